@@ -3,11 +3,13 @@ import pandas as pd
 import os
 import json
 import streamlit.components.v1 as components
-import random
 
 # --- LOCAL IMPORTS ---
 import styles
 import data_engine as db
+import filters
+import search
+import table_render
 
 # --- 1. SETUP ---
 st.set_page_config(page_title="FPL Metric Dashboard", page_icon="favicon.png", layout="wide")
@@ -81,6 +83,15 @@ st.markdown("""
         box-shadow: 0 0 15px rgba(0, 255, 133, 0.2);
     }
     .stTabs [data-baseweb="tab-highlight"] { display: none; }
+    div[role="radiogroup"] {
+        background-color: rgba(255, 255, 255, 0.03);
+        border-radius: 12px;
+        padding: 8px 16px;
+        border: 1px solid rgba(0, 255, 133, 0.2);
+        gap: 8px;
+        margin-bottom: 20px;
+    }
+    div[role="radiogroup"] label p { font-weight: 700; font-size: 0.9rem; text-transform: uppercase; }
 
     /* 6. TABLE STYLING */
     .player-table-container { 
@@ -146,70 +157,33 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. LOAD DATA ---
-df = db.fetch_main_data()
-df = df.fillna(0)
-
-# Calculate Metrics
-df['matches_played'] = df['matches_played'].replace(0, 1)
-df['minutes'] = df['minutes'].replace(0, 1)
-df['avg_minutes'] = df['minutes'] / df['matches_played']
-df['xgi_per_90'] = (df['xgi'] / df['minutes']) * 90
-df['xgc_per_90'] = (df['xgc'] / df['minutes']) * 90
-df['dc_per_90'] = (df['def_cons'] / df['minutes']) * 90
-df['tackles_per_90'] = (df['tackles'] / df['minutes']) * 90
-
-ep_map = db.get_expected_points_map()
-df['ep_next'] = df['player_id'].map(ep_map).fillna(0.0)
-
-# --- MOCK HISTORY DATA GENERATOR ---
-def get_mock_history(player_row):
-    team_map = db.get_team_map()
-    opponents = list(team_map.keys())
-    if player_row['team_name'] in opponents: opponents.remove(player_row['team_name'])
-    
-    history = []
-    current_gw = 24
-    for i in range(5):
-        gw = current_gw - 5 + i
-        opp = random.choice(opponents)
-        opp_code = team_map.get(opp, 0)
-        pts = random.randint(1, 15)
-        
-        color = "#F0F0F0" 
-        text_color = "#333"
-        if pts >= 7: 
-            color = "#00FF85" 
-            text_color = "#000"
-        elif pts <= 2:
-            color = "#EBEBEB" 
-            text_color = "#333"
-        else:
-            color = "#FFCC00" 
-            text_color = "#000"
-            
-        history.append({
-            "gw": f"GW{gw}",
-            "opp_code": opp_code,
-            "opp_name": opp[:3].upper(), 
-            "pts": pts,
-            "color": color,
-            "text_color": text_color
-        })
-    return history
+# Enriched frame (per-90 metrics, ep_next) cached per snapshot version in data_engine
+data_version = db.get_snapshot_version()
+df = db.load_player_frame(data_version)
+
+# --- FORM BADGE COLOURS ---
+def form_colors(pts):
+    if pts >= 7: return "#00FF85", "#000"
+    if pts <= 2: return "#EBEBEB", "#333"
+    return "#FFCC00", "#000"
 
 def render_player_profile(player_row):
-    history = get_mock_history(player_row)
+    history = db.get_player_form(player_row['player_id'])  # in-memory lookup, preloaded per snapshot
     t_code = db.get_team_map().get(player_row['team_name'], 0)
     
     history_html = ""
+    if not history:
+        history_html = '<span style="color: #AAA;">No match history recorded yet.</span>'
     for h in history:
+        color, text_color = form_colors(h['pts'])
         opp_badge = f"https://resources.premierleague.com/premierleague/badges/50/t{h['opp_code']}.png"
         history_html += f"""
         <div style="flex: 1; display: flex; flex-direction: column; align-items: center; background: rgba(255,255,255,0.05); border-radius: 8px; padding: 10px; min-width: 70px;">
             <span style="color: #AAA; font-size: 0.7rem; margin-bottom: 5px;">{h['gw']}</span>
             <img src="{opp_badge}" style="width: 30px; margin-bottom: 5px;">
-            <span style="color: #FFF; font-weight: bold; font-size: 0.8rem; margin-bottom: 5px;">{h['opp_name']}</span>
-            <div style="background-color: {h['color']}; color: {h['text_color']}; border-radius: 12px; padding: 2px 10px; font-weight: 900; font-size: 0.9rem;">
+            <span style="color: #FFF; font-weight: bold; font-size: 0.8rem; margin-bottom: 5px;">{h['opp_name']} ({'H' if h['was_home'] else 'A'})</span>
+            <span style="color: #AAA; font-size: 0.7rem; margin-bottom: 5px;">{h['minutes']}'</span>
+            <div style="background-color: {color}; color: {text_color}; border-radius: 12px; padding: 2px 10px; font-weight: 900; font-size: 0.9rem;">
                 {h['pts']}pts
             </div>
         </div>
@@ -229,7 +203,7 @@ def render_player_profile(player_row):
             </div>
             <div style="text-align: right;">
                 <div style="font-size: 0.9rem; color: #AAA;">Current Price</div>
-                <div style="font-size: 2rem; font-weight: 900; color: #FFF;">£{player_row['cost']}</div>
+                <div style="font-size: 2rem; font-weight: 900; color: #FFF;">£{player_row['cost']:.1f}</div>
             </div>
         </div>
         <div style="margin-top: 25px;">
@@ -274,19 +248,17 @@ with st.sidebar:
     st.markdown("""<a href="https://www.buymeacoffee.com/fplmetric" target="_blank" class="bmc-button"><img src="https://cdn.buymeacoffee.com/buttons/bmc-new-btn-logo.svg" alt="Buy me a coffee" class="bmc-logo"><span>Buy me a coffee</span></a>""", unsafe_allow_html=True)
 
 # --- FILTER LOGIC ---
-df = df[df['minutes'] >= 90]
-if exclude_unavailable:
-    df = df[~df['status'].isin(['i', 'u', 'n', 's'])]
-
-filtered = df[
-    (df['team_name'].isin(selected_teams)) & 
-    (df['position'].isin(position)) &
-    (df['cost'] <= max_price) & 
-    (df['selected_by_percent'] <= max_owner) &
-    (df['avg_minutes'] >= min_mpg) & 
-    (df['points_per_game'] >= min_ppg) & 
-    (df['dc_per_90'] >= min_dc90)
-]
+# Bitset/binary-search query over the per-snapshot filter index; index labels stay row positions
+filter_index = db.get_filter_index(data_version)
+rows = filters.select(filter_index, selected_teams, position, exclude_unavailable, {
+    'cost': (None, max_price),
+    'selected_by_percent': (None, max_owner),
+    'avg_minutes': (min_mpg, None),
+    'points_per_game': (min_ppg, None),
+    'dc_per_90': (min_dc90, None),
+})
+filtered = df.take(rows)
+filter_state = (tuple(selected_teams), tuple(position), exclude_unavailable, max_price, max_owner, min_mpg, min_ppg, min_dc90)
 
 # --- MAIN DISPLAY ---
 if "fpl_metric_logo.png" in [f.name for f in os.scandir(".")]: 
@@ -443,10 +415,10 @@ st.markdown(
 
 col1, col2, col3, col4 = st.columns(4)
 if not filtered.empty:
-    best_xgi = filtered.sort_values('xgi', ascending=False).iloc[0]
-    best_dc = filtered.sort_values('dc_per_90', ascending=False).iloc[0]
-    best_val = filtered.sort_values('value_season', ascending=False).iloc[0]
-    best_ppg = filtered.sort_values('points_per_game', ascending=False).iloc[0]
+    best_xgi = filtered.loc[filtered['xgi'].idxmax()]
+    best_dc = filtered.loc[filtered['dc_per_90'].idxmax()]
+    best_val = filtered.loc[filtered['value_season'].idxmax()]
+    best_ppg = filtered.loc[filtered['points_per_game'].idxmax()]
 
     def metric_card(title, name, value, icon):
         return f"""
@@ -470,10 +442,10 @@ if not filtered.empty:
         </div>
         """
 
-    with col1: st.markdown(metric_card("Threat King (xGI)", best_xgi['web_name'], f"{best_xgi['xgi']}", ""), unsafe_allow_html=True)
+    with col1: st.markdown(metric_card("Threat King (xGI)", best_xgi['web_name'], f"{best_xgi['xgi']:.2f}", ""), unsafe_allow_html=True)
     with col2: st.markdown(metric_card("Work Rate (DC/90)", best_dc['web_name'], f"{best_dc['dc_per_90']:.2f}", ""), unsafe_allow_html=True)
-    with col3: st.markdown(metric_card("Best Value", best_val['web_name'], f"{best_val['value_season']}", ""), unsafe_allow_html=True)
-    with col4: st.markdown(metric_card("Best PPG", best_ppg['web_name'], f"{best_ppg['points_per_game']}", ""), unsafe_allow_html=True)
+    with col3: st.markdown(metric_card("Best Value", best_val['web_name'], f"{best_val['value_season']:.1f}", ""), unsafe_allow_html=True)
+    with col4: st.markdown(metric_card("Best PPG", best_ppg['web_name'], f"{best_ppg['points_per_game']:.1f}", ""), unsafe_allow_html=True)
 
 # --- REFACTORED RENDER FUNCTION (CONTROLS IN ONE ROW) ---
 def render_modern_table(dataframe, column_config, sort_key):
@@ -495,16 +467,17 @@ def render_modern_table(dataframe, column_config, sort_key):
         # Search Box
         search_term = st.text_input("Find Player", placeholder="Type name...", label_visibility="visible", key=f"search_{sort_key}")
 
-    # 2. Filter Data
+    # 2. Filter Data (accent-insensitive, via the per-snapshot search index)
+    search_index = db.get_search_index(data_version)
     if search_term:
-        dataframe = dataframe[dataframe['web_name'].str.contains(search_term, case=False)]
+        dataframe = dataframe[search.match_mask(search_index, search_term)[dataframe.index.to_numpy()]]
 
     with c_view:
-        # Populate View Details Dropdown
+        # Populate View Details Dropdown (best matches first while searching)
         if dataframe.empty:
             player_opts = ["No players found"]
         else:
-            player_opts = ["Select to view details..."] + sorted(dataframe['web_name'].unique().tolist())
+            player_opts = ["Select to view details..."] + search.ranked_names(search_index, dataframe.index.to_numpy(), search_term)
         
         # If search matches exactly 1 player, default to them
         idx = 0
@@ -523,149 +496,100 @@ def render_modern_table(dataframe, column_config, sort_key):
         st.info("No players match your filters.")
         return
 
-    # 4. Sorting Logic
-    if selected_col == 'fixture_ease':
-        team_fixtures = db.get_team_upcoming_fixtures()
-        diff_map = {team: sum(f['diff'] for f in fixtures[:5]) for team, fixtures in team_fixtures.items()}
-        dataframe['fixture_ease'] = 30 - dataframe['team_name'].map(diff_map).fillna(25)
-
-    sorted_df = dataframe.sort_values(selected_col, ascending=False).head(100)
-    
-    # 5. Render Table
-    team_map = db.get_team_map()
-    team_fixtures = db.get_team_upcoming_fixtures()
-    
-    base_headers = ["Player", "Next 5", "Price", "Own%", "Matches"]
-    dynamic_headers = list(column_config.values())
-    all_headers = base_headers + dynamic_headers
-    header_html = "".join([f"<th>{h}</th>" for h in all_headers])
-    
-    fdr_colors = {1: '#375523', 2: '#00FF85', 3: '#EBEBEB', 4: '#FF0055', 5: '#680808'}
-    fdr_text = {1: 'white', 2: 'black', 3: 'black', 4: 'white', 5: 'white'}
-    
-    html_rows = ""
-    for _, row in sorted_df.iterrows():
-        t_code = team_map.get(row['team_name'], 0)
-        logo_img = f"https://resources.premierleague.com/premierleague/badges/20/t{t_code}.png"
-        
-        status = row['status']
-        row_style = ""
-        border_color = "rgba(255, 255, 255, 0.05)"
-        
-        if status in ['i', 'u', 'n', 's']: 
-            row_style = 'background-color: rgba(255, 0, 85, 0.15);' 
-            border_color = "#FF0055"
-        elif status == 'd': 
-            row_style = 'background-color: rgba(255, 204, 0, 0.15);' 
-            border_color = "#FFCC00"
+    # 4. Page controls: the full filtered list is browsable, only one page is rendered and sent
+    page_size = table_render.PAGE_SIZE
+    n_pages = -(-len(dataframe) // page_size)
+    page_key = f"page_{sort_key}"
+    if st.session_state.get(page_key, 1) > n_pages: st.session_state[page_key] = 1
+    c_count, c_page = st.columns([3, 1])
+    with c_page:
+        page = st.selectbox("Page", range(1, n_pages + 1), format_func=lambda p: f"Page {p} of {n_pages}", label_visibility="collapsed", key=page_key)
+    with c_count:
+        first = (page - 1) * page_size
+        st.caption(f"Showing {first + 1}–{min(first + page_size, len(dataframe))} of {len(dataframe)} players")
+
+    # 5. Sort + Render (memoized on filters, search, sort, page and snapshot version)
+    def build_table():
+        store = db.get_column_store(data_version)
+        if selected_col == 'fixture_ease':
+            diff_map = db.get_fixture_difficulty(5)
+            rank = table_render.rank_values(30 - pd.Series(store['team_name']).map(diff_map).fillna(25).to_numpy())
         else:
-            row_style = 'background-color: rgba(255, 255, 255, 0.03);' 
-            
-        status_dot = '<span class="status-pill" style="background-color: #00FF85;"></span>'
-        if status in ['i', 'u', 'n', 's']: status_dot = '<span class="status-pill" style="background-color: #FF0055;"></span>'
-        elif status == 'd': status_dot = '<span class="status-pill" style="background-color: #FFCC00;"></span>'
-        
-        html_rows += f"""<tr style="{row_style} border-left: 4px solid {border_color};">
-        <td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 12px;">
-            <div style="width: 10px;">{status_dot}</div><img src="{logo_img}" style="width: 35px;">
-            <div style="display: flex; flex-direction: column;"><span style="font-weight: bold; color: #FFF;">{row['web_name']}</span><span style="font-size: 0.8rem; color: #AAA;">{row['team_name']} | {row['position']}</span></div>
-        </div></td>"""
-        
-        my_fixtures = team_fixtures.get(row['team_name'], [])
-        fix_html = '<div class="mini-fix-container">'
-        for f in my_fixtures:
-            bg, txt = fdr_colors.get(f['diff'], '#333'), fdr_text.get(f['diff'], 'white')
-            fix_html += f'<div class="mini-fix-box" style="background-color: {bg}; color: {txt}; min-width: 38px; text-align: center;">{f["opp"]}</div>'
-        fix_html += '</div>'
-        html_rows += f'<td style="text-align: center;">{fix_html}</td>'
-        
-        for col_name in ['cost', 'selected_by_percent', 'matches_played'] + list(column_config.keys()):
-            val = row[col_name]
-            if isinstance(val, float): val = f"{val:.2f}"
-            if col_name == 'cost': val = f"£{float(val):.1f}"
-            elif col_name == 'selected_by_percent': val = f"{val}%"
-            elif col_name in ['matches_played', 'avg_minutes', 'total_points', 'goals_scored', 'assists', 'clean_sheets', 'goals_conceded']: val = int(float(val))
-            
-            style = "text-align: center;"
-            if col_name == selected_col: style += " font-weight: bold; color: #00FF85;"
-            html_rows += f"""<td style="{style}">{val}</td>"""
-        html_rows += "</tr>"
-
-    st.markdown(f"""<div class="player-table-container"><table class="modern-table"><thead><tr>{header_html}</tr></thead><tbody>{html_rows}</tbody></table></div>""", unsafe_allow_html=True)
-
-tab1, tab2, tab3, tab4 = st.tabs(["Overview", "Attack", "Defense", "Work Rate"])
-with tab1: render_modern_table(filtered, { "ep_next": "XP", "total_points": "Pts", "points_per_game": "PPG", "avg_minutes": "Mins/Gm", "news": "News" }, "sort_ov")
-with tab2: render_modern_table(filtered, { "xg": "xG", "xa": "xA", "xgi": "xGI", "xgi_per_90": "xGI/90", "goals_scored": "Goals", "assists": "Assists" }, "sort_att")
-with tab3: render_modern_table(filtered, { "clean_sheets": "Clean Sheets", "goals_conceded": "Conceded", "xgc": "xGC", "xgc_per_90": "xGC/90" }, "sort_def")
-with tab4: render_modern_table(filtered, { "def_cons": "Total DC", "dc_per_90": "DC/90", "tackles": "Tackles", "tackles_per_90": "Tackles/90", "cbi": "CBI" }, "sort_wr")
-
-st.markdown("---") 
-st.header("Fixture Difficulty Ticker")
-current_next_gw = db.get_next_gameweek_id()
-horizon_opts = ["Next 2 GWs", "Next 3 GWs", "Next 4 GWs", "Next 5 GWs", "Next 6 GWs", "Next 7 GWs", "Next 8 GWs"] + [f"GW {current_next_gw+i}" for i in range(5)]
-c1, c2, c3 = st.columns(3)
-with c1: s_order = st.selectbox("Sort Order", ["Easiest", "Hardest", "Alphabetical"])
-with c2: v_type = st.selectbox("Type", ["Overall", "Attack", "Defence"])
-with c3: horizon = st.selectbox("Horizon", horizon_opts)
-
-if horizon.startswith("Next"):
-    n_gws = int(horizon.split(" ")[1])
-    s_gw = current_next_gw
-    e_gw = current_next_gw + n_gws - 1
-else:
-    s_gw = e_gw = int(horizon.split(" ")[1])
-
-t_df = db.get_fixture_ticker(s_gw, e_gw)
-if s_order == "Alphabetical": t_df = t_df.sort_values('Team')
-else:
-    s_col = "Diff_Attack" if v_type == "Attack" else "Diff_Defence" if v_type == "Defence" else "Diff_Overall"
-    t_df = t_df.sort_values(s_col, ascending=(s_order == "Easiest"))
-
-gw_cols = [c for c in t_df.columns if c.startswith('GW')]
-h_rows = ""
-for i, r in t_df.iterrows():
-    f_cells = ""
-    for c in gw_cols:
-        d = r.get(f'Dif_{c}', 3)
-        bg, txt = {1:'#375523', 2:'#00FF85', 3:'#EBEBEB', 4:'#FF0055', 5:'#680808'}.get(d, '#EBEBEB'), 'white' if d in [1,4,5] else 'black'
-        f_cells += f'<td><span class="diff-badge" style="background-color: {bg}; color: {txt};">{r[c]}</span></td>'
-    h_rows += f"""<tr><td style="padding-left: 15px; display: flex; align-items: center;"><img src="{r['Logo']}" style="width: 25px; margin-right: 10px;"><b>{r['Team']}</b></td>{f_cells}</tr>"""
-st.markdown(f"""<div class="fixture-table-container"><table class="modern-table"><thead><tr><th>Team</th>{"".join([f"<th>{c}</th>" for c in gw_cols])}</tr></thead><tbody>{h_rows}</tbody></table></div>""", unsafe_allow_html=True)
+            rank = table_render.sort_rank(store, selected_col)
+        # Index labels are row positions in the snapshot frame, i.e. in its column store
+        rows = table_render.page_rows(rank, dataframe.index.to_numpy(), page - 1, page_size)
+        return table_render.render_player_table(store, rows, column_config, selected_col, fragments)
+
+    fragments = db.get_table_fragments()
+    cache_key = (data_version, fragments["version"], filter_state, search.fold(search_term), tuple(column_config), selected_col, page)
+    st.markdown(table_render.cached_render(cache_key, build_table), unsafe_allow_html=True)
+
+# --- LAZY TABS ---
+# A radio instead of st.tabs: st.tabs runs and ships every tab each rerun, this builds only the one on screen.
+# Widget state of hidden tabs (sort, search, page, player details) is re-asserted so it survives being
+# switched away from.
+TABLE_TABS = {
+    "Overview": ({ "ep_next": "XP", "total_points": "Pts", "points_per_game": "PPG", "avg_minutes": "Mins/Gm", "news": "News" }, "sort_ov"),
+    "Attack": ({ "xg": "xG", "xa": "xA", "xgi": "xGI", "xgi_per_90": "xGI/90", "goals_scored": "Goals", "assists": "Assists" }, "sort_att"),
+    "Defense": ({ "clean_sheets": "Clean Sheets", "goals_conceded": "Conceded", "xgc": "xGC", "xgc_per_90": "xGC/90" }, "sort_def"),
+    "Work Rate": ({ "def_cons": "Total DC", "dc_per_90": "DC/90", "tackles": "Tackles", "tackles_per_90": "Tackles/90", "cbi": "CBI" }, "sort_wr"),
+}
+for _, tab_key in TABLE_TABS.values():
+    for k in (tab_key, f"search_{tab_key}", f"page_{tab_key}", f"view_{tab_key}"):
+        if k in st.session_state: st.session_state[k] = st.session_state[k]
+
+active_tab = st.radio("Table", list(TABLE_TABS), horizontal=True, label_visibility="collapsed", key="table_tab")
+tab_columns, tab_key = TABLE_TABS[active_tab]
+render_modern_table(filtered, tab_columns, tab_key)
+
+# --- LOWER SECTIONS ---
+# Fragments: changing a ticker or movers control reruns only that section, not the table above it
+@st.fragment
+def render_ticker_section():
+    st.header("Fixture Difficulty Ticker")
+    current_next_gw = db.get_next_gameweek_id()
+    horizon_opts = ["Next 2 GWs", "Next 3 GWs", "Next 4 GWs", "Next 5 GWs", "Next 6 GWs", "Next 7 GWs", "Next 8 GWs"] + [f"GW {current_next_gw+i}" for i in range(5)]
+    c1, c2, c3 = st.columns(3)
+    with c1: s_order = st.selectbox("Sort Order", ["Easiest", "Hardest", "Alphabetical"])
+    with c2: v_type = st.selectbox("Type", ["Overall", "Attack", "Defence"])
+    with c3: horizon = st.selectbox("Horizon", horizon_opts)
+
+    if horizon.startswith("Next"):
+        n_gws = int(horizon.split(" ")[1])
+        s_gw = current_next_gw
+        e_gw = current_next_gw + n_gws - 1
+    else:
+        s_gw = e_gw = int(horizon.split(" ")[1])
+
+    st.markdown(db.get_fixture_ticker_html(s_gw, e_gw, s_order, v_type), unsafe_allow_html=True)
+
+@st.fragment
+def render_movers_section():
+    st.header("Market Movers")
+    price_window = st.selectbox("Window", list(db.PRICE_WINDOWS.keys()), format_func=db.PRICE_WINDOWS.get)
+    st.caption(f"Net price changes: {db.PRICE_WINDOWS[price_window].lower()}.")
+    movers = db.get_price_movers_html(price_window)
+    if movers is None: st.info("No price changes detected.")
+    else:
+        c_r, c_f = st.columns(2)
+        with c_r:
+            st.subheader("Price Risers")
+            if movers[0] is None: st.info("No risers.")
+            else: st.markdown(movers[0], unsafe_allow_html=True)
+        with c_f:
+            st.subheader("Price Fallers")
+            if movers[1] is None: st.info("No fallers.")
+            else: st.markdown(movers[1], unsafe_allow_html=True)
 
 st.markdown("---")
-st.header("Market Movers (Daily Change)")
-st.caption("Price changes over the last 24h.")
-df_c = db.get_db_price_changes()
-if df_c.empty: st.info("No price changes detected.")
-else:
-    c_r, c_f = st.columns(2)
-    # --- ARROW FIX: FILLED CIRCLES (Green/Black & Pink/White) ---
-    icon_up = '<svg width="24" height="24" viewBox="0 0 24 24" fill="none"><circle cx="12" cy="12" r="12" fill="#00FF85"/><path d="M7 14L12 9L17 14" stroke="black" stroke-width="3" stroke-linecap="round" stroke-linejoin="round"/></svg>'
-    icon_dn = '<svg width="24" height="24" viewBox="0 0 24 24" fill="none"><circle cx="12" cy="12" r="12" fill="#FF0055"/><path d="M7 10L12 15L17 10" stroke="white" stroke-width="3" stroke-linecap="round" stroke-linejoin="round"/></svg>'
-    
-    with c_r:
-        st.subheader("Price Risers")
-        risers = df_c[df_c['change'] > 0].sort_values('change', ascending=False)
-        if risers.empty: st.info("No risers.")
-        else:
-            h_r = ""
-            for _, r in risers.iterrows():
-                tc = db.get_team_map().get(r['team'], 0)
-                # +£ FIX & 1 Decimal
-                h_r += f"""<tr><td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 10px;">{icon_up}<img src="https://resources.premierleague.com/premierleague/badges/20/t{tc}.png" style="width: 30px;"><div><b>{r['web_name']}</b><br><span style="font-size:0.8rem; color:#AAA;">{r['team']}</span></div></div></td><td style="text-align: center;">£{r['cost']:.1f}</td><td style="text-align: center; color: #00FF85;">+£{r['change']:.1f}</td></tr>"""
-            st.markdown(f"""<div class="player-table-container"><table class="modern-table"><thead><tr><th>Player</th><th>Price</th><th>Change</th></tr></thead><tbody>{h_r}</tbody></table></div>""", unsafe_allow_html=True)
-            
-    with c_f:
-        st.subheader("Price Fallers")
-        fallers = df_c[df_c['change'] < 0].sort_values('change')
-        if fallers.empty: st.info("No fallers.")
-        else:
-            h_f = ""
-            for _, r in fallers.iterrows():
-                tc = db.get_team_map().get(r['team'], 0)
-                # -£ FIX (ABS Value) & 1 Decimal
-                h_f += f"""<tr><td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 10px;">{icon_dn}<img src="https://resources.premierleague.com/premierleague/badges/20/t{tc}.png" style="width: 30px;"><div><b>{r['web_name']}</b><br><span style="font-size:0.8rem; color:#AAA;">{r['team']}</span></div></div></td><td style="text-align: center;">£{r['cost']:.1f}</td><td style="text-align: center; color: #FF0055;">-£{abs(r['change']):.1f}</td></tr>"""
-            st.markdown(f"""<div class="player-table-container"><table class="modern-table"><thead><tr><th>Player</th><th>Price</th><th>Change</th></tr></thead><tbody>{h_f}</tbody></table></div>""", unsafe_allow_html=True)
+render_ticker_section()
+st.markdown("---")
+render_movers_section()
+
+# --- QUERY TIMINGS (add ?debug=1 to the URL) ---
+if st.query_params.get("debug") == "1":
+    with st.expander("Query Timings"):
+        st.dataframe(pd.DataFrame(db.get_query_log()), use_container_width=True)
 
 st.markdown("---")
 st.markdown("""<div style='text-align: center; color: #B0B0B0;'><p><strong>FPL Metric</strong> | Built for the FPL Community</p><p><a href="https://x.com/FPL_Metric" target="_blank" style="color: #00FF85; text-decoration: none;">Follow on X: @FPL_Metric</a></p></div>""", unsafe_allow_html=True)
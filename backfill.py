@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import collector
+import db_writer
+import fpl_api
+
+# --- HISTORICAL BACKFILL ---
+# Rebuilds one snapshot per finished gameweek from element-summary histories, either live from the API
+# or from a local dump (see --save-dump), and upserts fpl_player_gameweek. Snapshots go wherever the
+# collector's FPL_STORAGE sends them: fpl_full_history and/or the fpl_player_state deltas. Deltas only
+# extend a player's timeline forward, so backfill before (not after) delta mode has newer states.
+#
+#   python backfill.py                          # every finished GW of the current season
+#   python backfill.py --from-gw 10 --to-gw 15 --workers 16
+#   python backfill.py --save-dump dumps/2025-26  # also archive this season for later replays
+#   DATABASE_URL=<2023-24 db> python backfill.py --dump dumps/2023-24  # one archived season per run
+#
+# FPL reuses player ids and fixture ids every season, so each season needs its own database: the tables
+# have no season key, and a second season would overwrite fpl_player_gameweek and mix players in history.
+# Each GW is written in one transaction that first deletes that snapshot_time, so re-running is safe.
+# Not reconstructed: status/news (written as 'a' / '') and selected_by_percent (NULL: the history has
+# each GW's owner count but not that week's total number of managers).
+# Finished GWs are recorded in a checkpoint file and skipped on the next run (--force redoes them).
+# A GW whose capture time (just before the next deadline) is still ahead is left to the collector: a
+# future-dated reconstruction would become max(snapshot_time) and shadow the live snapshots.
+
+CHECKPOINT_PATH = os.environ.get("FPL_BACKFILL_CHECKPOINT", os.path.join(".fpl_cache", "backfill_checkpoint.json"))
+FORM_DAYS = 30  # FPL "form": points per match over the last 30 days
+
+# --- SOURCES ---
+def live_source(workers):
+    client = fpl_api.FPLClient(pool_size=workers)
+    return client.get_json("bootstrap-static/"), lambda pid: client.get_json(f"element-summary/{pid}/")
+
+def dump_source(directory):
+    # <dir>/bootstrap-static.json and <dir>/element-summary/<player_id>.json, as written by --save-dump
+    with open(os.path.join(directory, "bootstrap-static.json")) as f:
+        bootstrap = json.load(f)
+
+    def element_summary(pid):
+        path = os.path.join(directory, "element-summary", f"{pid}.json")
+        if not os.path.exists(path):
+            return {"history": []}
+        with open(path) as f:
+            return json.load(f)
+
+    return bootstrap, element_summary
+
+def save_dump(directory, bootstrap, summaries):
+    os.makedirs(os.path.join(directory, "element-summary"), exist_ok=True)
+    with open(os.path.join(directory, "bootstrap-static.json"), "w") as f:
+        json.dump(bootstrap, f)
+    for pid, summary in summaries.items():
+        with open(os.path.join(directory, "element-summary", f"{pid}.json"), "w") as f:
+            json.dump(summary, f)
+    print(f"💾 Saved bootstrap + {len(summaries)} element summaries to {directory}")
+
+def fetch_summaries(elements, element_summary, workers):
+    # Players who never played have an empty history; don't spend requests on them
+    played = [p['id'] for p in elements if p['minutes'] > 0]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        summaries = dict(zip(played, pool.map(element_summary, played)))
+    print(f"📦 Loaded {len(summaries)} histories in {time.perf_counter() - started:.1f}s with {workers} worker(s)")
+    return summaries
+
+# --- RECONSTRUCTION ---
+def parse_time(value):
+    # API timestamps are UTC ("...Z"); snapshot_time is stored naive
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+def gameweek_snapshot_times(events):
+    # GW n is captured just before the GW n + 1 deadline (the last GW: a week after its own deadline)
+    events = sorted(events, key=lambda e: e['id'])
+    times = {}
+    for i, event in enumerate(events):
+        if i + 1 < len(events):
+            times[event['id']] = parse_time(events[i + 1]['deadline_time']) - timedelta(minutes=1)
+        else:
+            times[event['id']] = parse_time(event['deadline_time']) + timedelta(days=7)
+    return times
+
+def season_key(bootstrap):
+    first = min(bootstrap['events'], key=lambda e: e['id'])
+    return first['deadline_time'][:4]
+
+def rebuild_player_row(p, history, gw, snapshot_time):
+    # The player's state after GW `gw`, rebuilt from the per-fixture history. Team and position are
+    # today's values (the API keeps no history of them); everything else is summed from the fixtures.
+    games = [g for g in history if g['round'] <= gw]
+
+    def total(key):
+        return sum(g.get(key, 0) for g in games)
+
+    def total_f(key):
+        return round(sum(float(g.get(key, 0)) for g in games), 2)
+
+    last = games[-1] if games else None
+    cost = last['value'] / 10.0 if last else p['now_cost'] / 10.0
+    matches_played = sum(1 for g in games if g['minutes'] > 0)
+    total_points = total('total_points')
+    recent = [g for g in games if g['minutes'] > 0 and g.get('kickoff_time')
+              and parse_time(g['kickoff_time']) >= snapshot_time - timedelta(days=FORM_DAYS)]
+    form = round(sum(g['total_points'] for g in recent) / len(recent), 1) if recent else 0.0
+
+    row = collector.build_player_row({
+        **p,
+        "now_cost": round(cost * 10),
+        "selected_by_percent": 0.0,
+        "transfers_in_event": last.get('transfers_in', 0) if last else 0,
+        "transfers_out_event": last.get('transfers_out', 0) if last else 0,
+        "form": form,
+        "value_form": round(form / cost, 1) if cost else 0.0,
+        "value_season": round(total_points / cost, 1) if cost else 0.0,
+        "minutes": total('minutes'),
+        "total_points": total_points,
+        "points_per_game": round(total_points / matches_played, 1) if matches_played else 0.0,
+        "starts": total('starts'),
+        "goals_scored": total('goals_scored'),
+        "assists": total('assists'),
+        "clean_sheets": total('clean_sheets'),
+        "goals_conceded": total('goals_conceded'),
+        "own_goals": total('own_goals'),
+        "penalties_saved": total('penalties_saved'),
+        "defensive_contribution": total('defensive_contribution'),
+        "tackles": total('tackles'),
+        "recoveries": total('recoveries'),
+        "clearances_blocks_interceptions": total('clearances_blocks_interceptions'),
+        "expected_goals": total_f('expected_goals'),
+        "expected_assists": total_f('expected_assists'),
+        "expected_goal_involvements": total_f('expected_goal_involvements'),
+        "expected_goals_conceded": total_f('expected_goals_conceded'),
+        "bonus": total('bonus'),
+        "bps": total('bps'),
+        "ict_index": total_f('ict_index'),
+    }, matches_played, snapshot_time.isoformat())
+    # Historical status/news are unknown; don't stamp today's injury onto old snapshots
+    row["status"], row["news"] = "a", ""
+    row["selected_by_percent"] = None
+    return row
+
+def price_change_rows(previous_rows, rows, snapshot_time):
+    # price_changes entries between two consecutive rebuilt snapshots
+    previous = {r["player_id"]: r["cost"] for r in previous_rows}
+    return [{"player_id": r["player_id"], "changed_at": snapshot_time.isoformat(),
+             "old_cost": previous[r["player_id"]], "new_cost": r["cost"]}
+            for r in rows if r["player_id"] in previous and previous[r["player_id"]] != r["cost"]]
+
+# --- CHECKPOINT ---
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+# --- WRITER ---
+def write_gameweek(conn, snapshot_time, rows, price_moves):
+    # Idempotent: the snapshot is replaced as a whole, replaying deltas is a no-op, and price moves are
+    # keyed on (player_id, changed_at). Same storage split as collector.write_batch.
+    started = time.perf_counter()
+    changed = 0
+    with db_writer.transaction(conn) as cursor:
+        if collector.STORAGE_MODE in ("full", "both"):
+            cursor.execute("DELETE FROM fpl_full_history WHERE snapshot_time = %s", (snapshot_time,))
+            db_writer.insert_rows(cursor, "fpl_full_history", rows)
+        if collector.STORAGE_MODE in ("delta", "both"):
+            changed = db_writer.apply_deltas(cursor, rows)
+        db_writer.upsert_rows(cursor, "price_changes", price_moves, ("player_id", "changed_at"))
+    db_writer.report_load(f"snapshot @ {snapshot_time:%Y-%m-%d %H:%M}", len(rows), time.perf_counter() - started)
+    if collector.STORAGE_MODE != "full":
+        print(f"   ...{changed}/{len(rows)} players changed (fpl_player_state)")
+
+def run_backfill(from_gw=None, to_gw=None, since=None, until=None, workers=collector.FETCH_WORKERS,
+                 dump=None, save_dump_to=None, checkpoint_path=CHECKPOINT_PATH, force=False):
+    bootstrap, element_summary = dump_source(dump) if dump else live_source(workers)
+    elements = bootstrap['elements']
+    summaries = fetch_summaries(elements, element_summary, workers)
+    if save_dump_to:
+        save_dump(save_dump_to, bootstrap, summaries)
+
+    snapshot_times = gameweek_snapshot_times(bootstrap['events'])
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    finished = sorted(e['id'] for e in bootstrap['events'] if e.get('finished') and snapshot_times[e['id']] <= now)
+    gws = [gw for gw in finished
+           if (from_gw is None or gw >= from_gw) and (to_gw is None or gw <= to_gw)
+           and (since is None or snapshot_times[gw] >= since) and (until is None or snapshot_times[gw] <= until)]
+
+    season = season_key(bootstrap)
+    checkpoint = load_checkpoint(checkpoint_path)
+    done = set(checkpoint.get(season, []))
+    todo = gws if force else [gw for gw in gws if gw not in done]
+    print(f"🗓️ Season {season}: {len(gws)} gameweek(s) in range, {len(gws) - len(todo)} already done, {len(todo)} to write")
+    if not todo:
+        return 0
+
+    histories = {pid: sorted(s.get('history', []), key=lambda g: (g['round'], g.get('kickoff_time') or ""))
+                 for pid, s in summaries.items()}
+
+    conn = collector.get_db_connection()
+    try:
+        db_writer.ensure_schema(conn)
+        gameweek_rows = [row for p in elements for row in collector.build_gameweek_rows(p, histories.get(p['id'], []))]
+        with db_writer.transaction(conn) as cursor:
+            db_writer.upsert_rows(cursor, "fpl_player_gameweek", gameweek_rows, collector.GAMEWEEK_KEY)
+        print(f"✅ Upserted {len(gameweek_rows)} fpl_player_gameweek rows")
+
+        # Every finished GW from the one before the first to-do is rebuilt (cheap, in memory) so price
+        # moves are always diffed against the true previous snapshot, even across checkpoint gaps
+        previous_rows = None
+        for gw in [gw for gw in finished if min(todo) - 1 <= gw <= max(todo)]:
+            snapshot_time = snapshot_times[gw]
+            rows = [rebuild_player_row(p, histories.get(p['id'], []), gw, snapshot_time) for p in elements]
+            if gw in todo:
+                price_moves = price_change_rows(previous_rows, rows, snapshot_time) if previous_rows else []
+                write_gameweek(conn, snapshot_time, rows, price_moves)
+                done.add(gw)
+                checkpoint[season] = sorted(done)
+                save_checkpoint(checkpoint_path, checkpoint)
+            previous_rows = rows
+
+        db_writer.refresh_latest(conn)
+    finally:
+        conn.close()
+    return len(todo)
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-gameweek snapshots from FPL player histories.")
+    parser.add_argument("--from-gw", type=int, help="first gameweek to rebuild")
+    parser.add_argument("--to-gw", type=int, help="last gameweek to rebuild")
+    parser.add_argument("--since", type=parse_date, help="only gameweeks captured on/after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_date, help="only gameweeks captured on/before this date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=collector.FETCH_WORKERS, help="parallel history fetches")
+    parser.add_argument("--dump", help="read a season dump directory instead of the live API")
+    parser.add_argument("--save-dump", help="also write the fetched season to this directory")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="checkpoint file of finished gameweeks")
+    parser.add_argument("--force", action="store_true", help="rewrite gameweeks already in the checkpoint")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = run_backfill(args.from_gw, args.to_gw, args.since, args.until, args.workers,
+                           args.dump, args.save_dump, args.checkpoint, args.force)
+    print(f"🏁 Backfilled {written} gameweek(s) in {time.perf_counter() - started:.1f}s")
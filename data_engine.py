@@ -1,172 +1,455 @@
 import streamlit as st
 import pandas as pd
-import requests
+import numpy as np
 import json
-from sqlalchemy import create_engine
-from datetime import datetime
+from sqlalchemy import text
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+import database
+import filters
+import fpl_api
+import search
+import snapshot_store
+import table_render
 
 # --- DATABASE CONNECTION ---
 def get_engine():
+    # Pooled engine (pre-ping, size limits, statement timeout) shared with the collector's config
     try:
-        url = st.secrets["DATABASE_URL"]
-        if url.startswith("postgres://"):
-            url = url.replace("postgres://", "postgresql://", 1)
-        return create_engine(url)
+        return database.get_engine(st.secrets["DATABASE_URL"])
     except Exception as e:
         st.error(f"Database Connection Failed: {e}")
         return None
 
 engine = get_engine()
 
+# --- FPL SNAPSHOT ---
+# bootstrap-static and the full fixture list, downloaded and parsed once and shared by every
+# derived map below. Lookup tables are read-only views so cached state can't be mutated by callers.
+@dataclass(frozen=True)
+class FPLSnapshot:
+    teams: Mapping             # team id -> team dict
+    events: Mapping            # event id -> event dict
+    elements: Mapping          # player id -> element dict
+    team_ids_by_name: Mapping  # team name (plus "Nottm Forest" alias) -> team id
+    fixtures: tuple            # every fixture of the season, API order
+    future_fixtures: tuple     # not yet kicked off and scheduled into a gameweek
+    next_event: Optional[dict]
+
+def build_snapshot(static, fixtures):
+    teams = {t['id']: t for t in static['teams']}
+    team_ids_by_name = {t['name']: t['id'] for t in static['teams']}
+    if "Nott'm Forest" in team_ids_by_name:
+        team_ids_by_name["Nottm Forest"] = team_ids_by_name["Nott'm Forest"]
+    return FPLSnapshot(
+        teams=MappingProxyType(teams),
+        events=MappingProxyType({e['id']: e for e in static['events']}),
+        elements=MappingProxyType({p['id']: p for p in static['elements']}),
+        team_ids_by_name=MappingProxyType(team_ids_by_name),
+        fixtures=tuple(fixtures),
+        future_fixtures=tuple(f for f in fixtures if not f.get('started') and f['event'] is not None),
+        next_event=next((e for e in static['events'] if e['is_next']), None),
+    )
+
+@st.cache_resource(ttl=3600)
+def get_snapshot():
+    return build_snapshot(fpl_api.get_json('bootstrap-static/'), fpl_api.get_json('fixtures/'))
+
 # --- API FUNCTIONS ---
 
-@st.cache_data(ttl=3600)
 def get_team_map():
-    static = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
-    t_map = {t['name']: t['code'] for t in static['teams']}
-    if "Nott'm Forest" in t_map:
-        t_map["Nottm Forest"] = t_map["Nott'm Forest"]
-    return t_map
+    snap = get_snapshot()
+    return {name: snap.teams[t_id]['code'] for name, t_id in snap.team_ids_by_name.items()}
 
-@st.cache_data(ttl=3600)
 def get_expected_points_map():
-    static = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
     ep_map = {}
-    for p in static['elements']:
+    for p_id, p in get_snapshot().elements.items():
         try:
-            ep_map[p['id']] = float(p.get('ep_next', 0))
+            ep_map[p_id] = float(p.get('ep_next', 0))
         except:
-            ep_map[p['id']] = 0.0
+            ep_map[p_id] = 0.0
     return ep_map
 
-@st.cache_data(ttl=3600)
 def get_next_gw_data():
-    static = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
-    next_event = next((e for e in static['events'] if e['is_next']), None)
+    snap = get_snapshot()
+    next_event = snap.next_event
     if not next_event: return None, None, []
         
     gw_name = next_event['name']
     deadline_iso = next_event['deadline_time']
-    teams = {t['id']: {'name': t['short_name'], 'code': t['code']} for t in static['teams']}
-    fixtures = requests.get(f'https://fantasy.premierleague.com/api/fixtures/?event={next_event["id"]}').json()
     
     processed_fixtures = []
-    for f in fixtures:
-        home_t = teams.get(f['team_h'])
-        away_t = teams.get(f['team_a'])
+    for f in snap.fixtures:
+        if f['event'] != next_event['id']: continue
+        home_t = snap.teams[f['team_h']]
+        away_t = snap.teams[f['team_a']]
         processed_fixtures.append({
-            'home_name': home_t['name'], 'home_code': home_t['code'],
-            'away_name': away_t['name'], 'away_code': away_t['code'],
+            'home_name': home_t['short_name'], 'home_code': home_t['code'],
+            'away_name': away_t['short_name'], 'away_code': away_t['code'],
             'iso_time': f['kickoff_time'] 
         })
     return gw_name, deadline_iso, processed_fixtures
 
-@st.cache_data(ttl=3600)
 def get_next_gameweek_id():
-    fixtures = requests.get('https://fantasy.premierleague.com/api/fixtures/?future=1').json()
+    fixtures = get_snapshot().future_fixtures
     if fixtures: return fixtures[0]['event']
     return 38 
 
+# --- FIXTURE FRAME ---
+@st.cache_data(ttl=3600)
+def get_team_fixture_frame():
+    # Long form: one row per team per future fixture (each fixture appears once home, once away),
+    # in fixture order within each team. Every ticker horizon is a slice of this frame.
+    snap = get_snapshot()
+    teams = pd.DataFrame(list(snap.teams.values())).set_index('id')
+    fx = pd.DataFrame(list(snap.future_fixtures), columns=['event', 'team_h', 'team_a', 'team_h_difficulty', 'team_a_difficulty'])
+    fx['order'] = range(len(fx))
+
+    home = pd.DataFrame({'team_id': fx['team_h'], 'opp_id': fx['team_a'], 'event': fx['event'],
+                         'is_home': True, 'difficulty': fx['team_h_difficulty'], 'order': fx['order']})
+    away = pd.DataFrame({'team_id': fx['team_a'], 'opp_id': fx['team_h'], 'event': fx['event'],
+                         'is_home': False, 'difficulty': fx['team_a_difficulty'], 'order': fx['order']})
+    long = pd.concat([home, away], ignore_index=True).sort_values(['team_id', 'order'], kind='stable')
+
+    opp = teams.loc[long['opp_id']]
+    is_home = long['is_home'].to_numpy()
+    # Attack difficulty = opponent's defence, defence difficulty = opponent's attack, at the opponent's venue
+    long['opp_def'] = np.where(is_home, opp['strength_defence_away'], opp['strength_defence_home'])
+    long['opp_att'] = np.where(is_home, opp['strength_attack_away'], opp['strength_attack_home'])
+    long['opp_short'] = opp['short_name'].to_numpy()
+    long['label'] = long['opp_short'] + np.where(is_home, ' (H)', ' (A)')
+    return long.reset_index(drop=True)
+
+# --- FIXTURE INDEX ---
+# Per-team prefix sums built once per data refresh, shared by the ticker and the player table's
+# "Fixtures" sort. Along the gameweek axis (a double gameweek sums both fixtures, a blank adds 0), any
+# "sum over GWs a..b" is cum[:, b + 1] - cum[:, a]. Along the fixture axis (each team's future fixtures
+# in order, as in the "Next 5" strip), "sum over the next n fixtures" is fixture_fdr_cum[:, n].
+@dataclass(frozen=True)
+class FixtureIndex:
+    team_ids: np.ndarray         # row -> team id
+    team_rows: Mapping           # team id and team name -> row
+    fdr_cum: np.ndarray          # [T, G + 1] FDR by gameweek
+    opp_att_cum: np.ndarray      # [T, G + 1] opponent attack strength (defensive difficulty)
+    opp_def_cum: np.ndarray      # [T, G + 1] opponent defence strength (attacking difficulty)
+    fixture_fdr_cum: np.ndarray  # [T, F + 1] FDR by fixture ordinal; padded with the total past a team's last fixture
+
+def prefix_sum(arr):
+    return np.concatenate([np.zeros((arr.shape[0], 1), dtype=np.int64), np.cumsum(arr, axis=1)], axis=1)
+
+def build_fixture_index(snap, long):
+    team_ids = np.array(sorted(snap.teams.keys()))
+    row_of = {t: i for i, t in enumerate(team_ids)}
+    n_gws = max([e for e in snap.events.keys()] + [int(long['event'].max()) if len(long) else 0]) + 1
+
+    rows = long['team_id'].map(row_of).to_numpy()
+    gws = long['event'].to_numpy(dtype=int)
+    sums = {}
+    for name, col in (('fdr', 'difficulty'), ('opp_att', 'opp_att'), ('opp_def', 'opp_def')):
+        arr = np.zeros((len(team_ids), n_gws), dtype=np.int32)
+        np.add.at(arr, (rows, gws), long[col].to_numpy())
+        sums[f'{name}_cum'] = prefix_sum(arr)
+
+    # long is in fixture order within each team, so cumcount is the fixture ordinal
+    ordinals = long.groupby('team_id', sort=False).cumcount().to_numpy()
+    by_fixture = np.zeros((len(team_ids), int(ordinals.max()) + 1 if len(long) else 0), dtype=np.int32)
+    by_fixture[rows, ordinals] = long['difficulty'].to_numpy()
+
+    team_rows = dict(row_of)
+    for t_id, info in snap.teams.items():
+        team_rows[info['name']] = row_of[t_id]
+    if "Nott'm Forest" in team_rows: team_rows["Nottm Forest"] = team_rows["Nott'm Forest"]
+    return FixtureIndex(team_ids=team_ids, team_rows=MappingProxyType(team_rows),
+                        fixture_fdr_cum=prefix_sum(by_fixture), **sums)
+
+@st.cache_resource(ttl=3600)
+def get_fixture_index():
+    return build_fixture_index(get_snapshot(), get_team_fixture_frame())
+
+def window_sum(cum, start_gw, end_gw):
+    # Per-team sum over GWs start..end (inclusive) from a prefix-sum array: O(1) per team
+    n_gws = cum.shape[1] - 1
+    lo = min(max(start_gw, 0), n_gws)
+    hi = min(max(end_gw + 1, lo), n_gws)
+    return cum[:, hi] - cum[:, lo]
+
+def get_fixture_difficulty(n=5):
+    # Team name -> summed FDR over the team's next n fixtures: the same fixtures as the player table's
+    # "Next 5" strip. Counting by gameweek instead would score a blank week as 0 and rank it "easiest".
+    idx = get_fixture_index()
+    totals = idx.fixture_fdr_cum[:, min(n, idx.fixture_fdr_cum.shape[1] - 1)]
+    return {name: int(totals[row]) for name, row in idx.team_rows.items() if isinstance(name, str)}
+
 @st.cache_data(ttl=3600) 
 def get_fixture_ticker(start_gw, end_gw):
-    static = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
-    teams = {
-        t['id']: {
-            'name': t['name'], 'short': t['short_name'], 'code': t['code'],
-            'str_att_h': t['strength_attack_home'], 'str_att_a': t['strength_attack_away'],
-            'str_def_h': t['strength_defence_home'], 'str_def_a': t['strength_defence_away']
-        } for t in static['teams']
-    }
-    fixtures = requests.get('https://fantasy.premierleague.com/api/fixtures/?future=1').json()
-    ticker_data = []
-    
-    for team_id, team_info in teams.items():
-        team_fixtures = [
-            f for f in fixtures 
-            if (f['team_h'] == team_id or f['team_a'] == team_id) and 
-               (f['event'] >= start_gw and f['event'] <= end_gw)
-        ]
-        logo_url = f"https://resources.premierleague.com/premierleague/badges/50/t{team_info['code']}.png"
-        row = {'Logo': logo_url, 'Team': team_info['name'], 'Diff_Overall': 0, 'Diff_Attack': 0, 'Diff_Defence': 0}
-        
-        for f in team_fixtures:
-            is_home = f['team_h'] == team_id
-            opponent_id = f['team_a'] if is_home else f['team_h']
-            difficulty = f['team_h_difficulty'] if is_home else f['team_a_difficulty']
-            opp_stats = teams[opponent_id]
-            
-            if is_home:
-                opp_def = opp_stats['str_def_a']; opp_att = opp_stats['str_att_a']
-            else:
-                opp_def = opp_stats['str_def_h']; opp_att = opp_stats['str_att_h']
-            
-            col_name = f"GW{f['event']}"
-            loc = "(H)" if is_home else "(A)"
-            row[col_name] = f"{opp_stats['short']} {loc}"
-            row['Diff_Overall'] += difficulty
-            row['Diff_Attack'] += opp_def
-            row['Diff_Defence'] += opp_att
-            row[f'Dif_{col_name}'] = difficulty 
-
-        ticker_data.append(row)
-    return pd.DataFrame(ticker_data)
+    snap = get_snapshot()
+    idx = get_fixture_index()
+    long = get_team_fixture_frame()
+    window = long[(long['event'] >= start_gw) & (long['event'] <= end_gw)]
+
+    team_ids = [int(t) for t in idx.team_ids]
+    ticker = pd.DataFrame({
+        'Logo': [f"https://resources.premierleague.com/premierleague/badges/50/t{snap.teams[t]['code']}.png" for t in team_ids],
+        'Team': [snap.teams[t]['name'] for t in team_ids],
+        'Diff_Overall': window_sum(idx.fdr_cum, start_gw, end_gw),
+        'Diff_Attack': window_sum(idx.opp_def_cum, start_gw, end_gw),
+        'Diff_Defence': window_sum(idx.opp_att_cum, start_gw, end_gw),
+    }, index=team_ids)
+
+    # GW columns in one pivot each; a double gameweek shows its last fixture (difficulty still sums both)
+    by_gw = window.groupby(['team_id', 'event'])
+    labels = by_gw['label'].last().unstack().reindex(team_ids)
+    diffs = by_gw['difficulty'].last().unstack().reindex(team_ids)
+    for gw in sorted(labels.columns):
+        ticker[f'GW{gw}'] = labels[gw]
+        ticker[f'Dif_GW{gw}'] = diffs[gw]
+    return ticker.reset_index(drop=True)
 
-@st.cache_data(ttl=3600)
 def get_team_upcoming_fixtures():
-    static = requests.get('https://fantasy.premierleague.com/api/bootstrap-static/').json()
-    fixtures = requests.get('https://fantasy.premierleague.com/api/fixtures/?future=1').json()
-    teams_info = {t['id']: {'name': t['name'], 'short': t['short_name']} for t in static['teams']}
-    team_fixtures_map = {}
-    for team_id, info in teams_info.items():
-        my_fixtures = [f for f in fixtures if f['team_h'] == team_id or f['team_a'] == team_id][:5]
-        fixture_list = []
-        for f in my_fixtures:
-            is_home = f['team_h'] == team_id
-            opponent_id = f['team_a'] if is_home else f['team_h']
-            difficulty = f['team_h_difficulty'] if is_home else f['team_a_difficulty']
-            opp_short = teams_info[opponent_id]['short']
-            fixture_list.append({'opp': opp_short, 'diff': difficulty})
-        team_fixtures_map[info['name']] = fixture_list
-        if info['name'] == "Nott'm Forest": team_fixtures_map["Nottm Forest"] = fixture_list
+    snap = get_snapshot()
+    long = get_team_fixture_frame()
+    next5 = long.groupby('team_id', sort=False).head(5)
+    team_fixtures_map = {info['name']: [] for info in snap.teams.values()}
+    for team_id, opp, diff in zip(next5['team_id'], next5['opp_short'], next5['difficulty']):
+        team_fixtures_map[snap.teams[team_id]['name']].append({'opp': opp, 'diff': int(diff)})
+    if "Nott'm Forest" in team_fixtures_map: team_fixtures_map["Nottm Forest"] = team_fixtures_map["Nott'm Forest"]
     return team_fixtures_map
 
-def get_db_price_changes():
-    sql = """
-    WITH Ranked AS (
-        SELECT player_id, web_name, team_name, position, cost, selected_by_percent,
-        ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY snapshot_time DESC) as rn
-        FROM human_readable_fpl
+# --- PRICE CHANGES ---
+PRICE_WINDOWS = {"24h": "Last 24 Hours", "7d": "Last 7 Days", "gw": "Since Gameweek Start"}
+
+def price_window_start(window):
+    # Naive UTC, matching the collector's snapshot_time
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if window == "7d":
+        return now - timedelta(days=7)
+    if window == "gw":
+        current = next((e for e in get_snapshot().events.values() if e.get('is_current')), None)
+        if current:
+            return datetime.fromisoformat(current['deadline_time'].replace("Z", "+00:00")).replace(tzinfo=None)
+    return now - timedelta(hours=24)
+
+@st.cache_data(ttl=600)
+def get_db_price_changes(window="24h"):
+    # Net move per player over the window, from the collector-maintained price_changes table
+    # (indexed on changed_at) joined to the one-row-per-player fpl_latest.
+    sql = text("""
+    SELECT l.web_name, l.team_name AS team, l.position, l.cost,
+           SUM(c.new_cost - c.old_cost)::FLOAT AS change, l.selected_by_percent
+    FROM price_changes c JOIN fpl_latest l ON l.player_id = c.player_id
+    WHERE c.changed_at >= :since
+    GROUP BY l.player_id, l.web_name, l.team_name, l.position, l.cost, l.selected_by_percent
+    HAVING SUM(c.new_cost - c.old_cost) <> 0
+    """)
+    try:
+        df = database.read_sql(sql, engine, params={"since": price_window_start(window)})
+    except Exception as e:
+        # Database unreachable: last good result for this window, if any
+        local = snapshot_store.read_frame(f"price_changes_{window}")
+        return local if local is not None else pd.DataFrame()
+    snapshot_store.write_frame(f"price_changes_{window}", df)
+    return df
+
+def fetch_main_data(version=None):
+    # Read-through: the local Parquet snapshot for this version if present (written by the collector
+    # or by an earlier miss), otherwise fpl_latest, which is then saved locally.
+    local = snapshot_store.read_players(version)
+    if local is not None:
+        return local
+    # fpl_latest is maintained by the collector: one row per player, constant-time regardless of history size
+    df = database.read_sql(snapshot_store.LATEST_PLAYERS_SQL, engine)
+    if not df.empty:
+        snapshot_store.write_players(df, str(df['snapshot_time'].max()))
+    return df
+
+@st.cache_data(ttl=60)
+def get_snapshot_version():
+    # Newest snapshot_time in fpl_latest; changes only when the collector publishes a run.
+    # Cached briefly so widget reruns don't even run this query. Falls back to the newest local snapshot.
+    try:
+        version = database.read_sql("SELECT max(snapshot_time) AS version FROM fpl_latest", engine)['version'].iloc[0]
+    except Exception as e:
+        print(f"⚠️ Database unreachable, serving the local snapshot: {e}")
+        return snapshot_store.latest_version()
+    return None if pd.isna(version) else str(version)
+
+# --- PLAYER FRAME ---
+# Explicit dtypes for the shared player frame: categoricals for the low-cardinality strings, int16 for
+# counts (minutes tops out around 3,400 a season), float32 for prices, rates and xStats.
+CATEGORY_COLUMNS = ['team_name', 'position', 'status', 'news']
+PLAYER_SCHEMA = {
+    'player_id': np.int32,
+    **{c: 'category' for c in CATEGORY_COLUMNS},
+    **{c: np.int16 for c in ['minutes', 'starts', 'matches_played', 'total_points', 'goals_scored', 'assists',
+                             'clean_sheets', 'goals_conceded', 'def_cons', 'tackles', 'recoveries', 'cbi', 'bps']},
+    **{c: np.float32 for c in ['cost', 'selected_by_percent', 'points_per_game', 'xg', 'xa', 'xgi', 'xgc',
+                               'form', 'value_season']},
+}
+
+def apply_player_schema(df):
+    # Column by column, so there is no full-frame fillna copy. Missing news is '' rather than 0.
+    columns = {}
+    for col in df.columns:
+        dtype = PLAYER_SCHEMA.get(col)
+        if dtype == 'category':
+            columns[col] = df[col].fillna('').astype('category')
+        elif dtype is not None:
+            columns[col] = df[col].fillna(0).astype(dtype)
+        else:
+            columns[col] = df[col]
+    return pd.DataFrame(columns, copy=False)
+
+def per_90(values, minutes):
+    return values.astype(np.float32) / minutes * np.float32(90)
+
+@st.cache_resource(max_entries=2)
+def load_player_frame(version):
+    # Keyed on the snapshot version: recomputed only when the collector writes a new snapshot.
+    # Shared by every session (cache_resource, no per-caller copy), so callers must treat it as read-only.
+    df = apply_player_schema(fetch_main_data(version))
+
+    # Calculate Metrics (on the arrays; 0 matches / minutes count as 1 to keep the ratios finite)
+    matches = np.where(df['matches_played'].to_numpy() == 0, 1, df['matches_played'].to_numpy()).astype(np.int16)
+    minutes = np.where(df['minutes'].to_numpy() == 0, 1, df['minutes'].to_numpy()).astype(np.int16)
+    minutes_f = minutes.astype(np.float32)
+    derived = {
+        'matches_played': matches,
+        'minutes': minutes,
+        'avg_minutes': minutes_f / matches,
+        'xgi_per_90': per_90(df['xgi'].to_numpy(), minutes_f),
+        'xgc_per_90': per_90(df['xgc'].to_numpy(), minutes_f),
+        'dc_per_90': per_90(df['def_cons'].to_numpy(), minutes_f),
+        'tackles_per_90': per_90(df['tackles'].to_numpy(), minutes_f),
+    }
+    ep_map = get_expected_points_map()
+    derived['ep_next'] = df['player_id'].map(ep_map).fillna(0.0).to_numpy(dtype=np.float32)
+    for col, values in derived.items():
+        df[col] = values
+    return df
+
+def get_player_frame():
+    return load_player_frame(get_snapshot_version())
+
+@st.cache_resource(max_entries=2)
+def get_filter_index(version):
+    return filters.build_filter_index(load_player_frame(version))
+
+@st.cache_resource(max_entries=2)
+def get_search_index(version):
+    return search.build_search_index(load_player_frame(version)['web_name'])
+
+# --- TABLE RENDERING ---
+@st.cache_resource(max_entries=2)
+def get_column_store(version):
+    # Shared per snapshot: table_render memoizes formatted cells into it as tabs are rendered
+    return table_render.column_store(load_player_frame(version))
+
+@st.cache_resource(ttl=3600)
+def get_table_fragments():
+    return table_render.build_fragments(get_team_map(), get_team_upcoming_fixtures())
+
+@st.cache_data(ttl=3600)
+def get_fixture_ticker_html(start_gw, end_gw, order, view):
+    t_df = get_fixture_ticker(start_gw, end_gw)
+    if order == "Alphabetical": t_df = t_df.sort_values('Team')
+    else:
+        s_col = "Diff_Attack" if view == "Attack" else "Diff_Defence" if view == "Defence" else "Diff_Overall"
+        t_df = t_df.sort_values(s_col, ascending=(order == "Easiest"))
+    return table_render.render_fixture_ticker(t_df)
+
+@st.cache_data(ttl=600)
+def get_price_movers_html(window="24h"):
+    # (risers, fallers) HTML, None for an empty side; same TTL as the price query itself
+    df_c = get_db_price_changes(window)
+    if df_c.empty:
+        return None
+    team_map = get_team_map()
+    risers = df_c[df_c['change'] > 0].sort_values('change', ascending=False)
+    fallers = df_c[df_c['change'] < 0].sort_values('change')
+    return (
+        table_render.render_price_movers(risers, team_map, rising=True) if not risers.empty else None,
+        table_render.render_price_movers(fallers, team_map, rising=False) if not fallers.empty else None,
     )
-    SELECT * FROM Ranked WHERE rn <= 2;
-    """
+
+# --- PLAYER FORM ---
+# Last FORM_MATCHES appearances of every player, loaded in one query per snapshot into dense
+# [player_id, match] arrays (oldest first). Opening a profile is an array lookup, not a round-trip.
+FORM_MATCHES = 5
+
+@dataclass(frozen=True)
+class FormBlock:
+    count: np.ndarray          # [P] matches stored per player
+    round: np.ndarray          # [P, N]
+    opponent_team: np.ndarray  # [P, N]
+    was_home: np.ndarray       # [P, N]
+    minutes: np.ndarray        # [P, N]
+    points: np.ndarray         # [P, N]
+
+def build_form_block(rows, n=FORM_MATCHES):
+    # rows: player_id, rn (1 = most recent), round, opponent_team, was_home, minutes, total_points
+    n_players = int(rows['player_id'].max()) + 1 if len(rows) else 1
+    pid = rows['player_id'].to_numpy(dtype=np.int64)
+    count = np.bincount(pid, minlength=n_players).astype(np.int8)
+    col = count[pid] - rows['rn'].to_numpy(dtype=np.int64)
+    shape = (n_players, n)
+    block = {}
+    for name, col_name, dtype in (('round', 'round', np.int16), ('opponent_team', 'opponent_team', np.int16),
+                                  ('was_home', 'was_home', bool), ('minutes', 'minutes', np.int16),
+                                  ('points', 'total_points', np.int16)):
+        arr = np.zeros(shape, dtype=dtype)
+        arr[pid, col] = rows[col_name].to_numpy(dtype=dtype)
+        block[name] = arr
+    return FormBlock(count=count, **block)
+
+@st.cache_resource(max_entries=2)
+def load_form_block(version, n=FORM_MATCHES):
+    # Raises on a database error, so a failure is never cached for the snapshot's lifetime
+    query = text("""
+    SELECT player_id, rn, round, opponent_team, was_home, minutes, total_points
+    FROM (
+        SELECT player_id, round, opponent_team, was_home, minutes, total_points,
+               ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY kickoff_time DESC) AS rn
+        FROM fpl_player_gameweek
+        WHERE kickoff_time IS NOT NULL
+    ) g
+    WHERE rn <= :n
+    """)
+    return build_form_block(database.read_sql(query, engine, params={"n": n}), n)
+
+def get_form_block(version, n=FORM_MATCHES):
     try:
-        df_hist = pd.read_sql(sql, engine)
-        if df_hist.empty: return pd.DataFrame()
-        df_latest = df_hist[df_hist['rn'] == 1].set_index('player_id')
-        df_prev = df_hist[df_hist['rn'] == 2].set_index('player_id')
-        merged = df_latest.join(df_prev, lsuffix='_now', rsuffix='_old')
-        merged['change'] = merged['cost_now'] - merged['cost_old']
-        movers = merged[merged['change'] != 0].copy()
-        clean_movers = []
-        for pid, row in movers.iterrows():
-            clean_movers.append({
-                'web_name': row['web_name_now'], 'team': row['team_name_now'], 'position': row['position_now'],
-                'cost': row['cost_now'], 'change': row['change'], 'selected_by_percent': row['selected_by_percent_now']
-            })
-        return pd.DataFrame(clean_movers)
+        return load_form_block(version, n)
     except Exception as e:
-        return pd.DataFrame()
-
-def fetch_main_data():
-    query = """
-    SELECT DISTINCT ON (player_id)
-        player_id, web_name, team_name, position, cost, selected_by_percent, status, news,
-        minutes, starts, matches_played, total_points, points_per_game,
-        xg, xa, xgi, goals_scored, assists, clean_sheets, goals_conceded, xgc,
-        def_cons, tackles, recoveries, cbi, form, value_season, bps
-    FROM human_readable_fpl ORDER BY player_id, snapshot_time DESC
-    """
-    return pd.read_sql(query, engine)
+        # Empty block for this rerun only; the next one retries the query
+        print(f"⚠️ Could not load recent form: {e}")
+        return build_form_block(pd.DataFrame(columns=['player_id', 'rn', 'round', 'opponent_team', 'was_home', 'minutes', 'total_points']), n)
+
+def get_player_form(player_id, n=FORM_MATCHES):
+    # Last n matches for one player, oldest first, from the preloaded block
+    block = get_form_block(get_snapshot_version(), n)
+    player_id = int(player_id)
+    if player_id >= len(block.count):
+        return []
+    teams = get_snapshot().teams
+    form = []
+    for i in range(int(block.count[player_id])):
+        opp = teams.get(int(block.opponent_team[player_id, i]), {})
+        form.append({
+            "gw": f"GW{block.round[player_id, i]}",
+            "opp_code": opp.get('code', 0),
+            "opp_name": opp.get('short_name', '???'),
+            "was_home": bool(block.was_home[player_id, i]),
+            "minutes": int(block.minutes[player_id, i]),
+            "pts": int(block.points[player_id, i]),
+        })
+    return form
+
+def get_query_log():
+    # Most recent queries first: [{sql, rows, ms, at}, ...]
+    return list(reversed(database.QUERY_LOG))
 
 def create_deadline_widget(gw_name, deadline_iso, fixtures_data):
     fixtures_json = json.dumps(fixtures_data)
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, event
+
+# --- CONFIGURATION ---
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))            # seconds
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "15000"))
+SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "500"))
+
+# --- ENGINE ---
+_engines = {}
+_engines_lock = threading.Lock()
+
+def normalize_url(url):
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def get_engine(url, statement_timeout_ms=STATEMENT_TIMEOUT_MS):
+    # One pooled engine per (url, timeout) per process, shared by the app and the collector
+    key = (normalize_url(url), statement_timeout_ms)
+    with _engines_lock:
+        if key not in _engines:
+            engine = create_engine(
+                key[0],
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+            if statement_timeout_ms:
+                @event.listens_for(engine, "connect")
+                def set_statement_timeout(dbapi_conn, _record):
+                    with dbapi_conn.cursor() as cursor:
+                        cursor.execute(f"SET statement_timeout = {int(statement_timeout_ms)}")
+                    dbapi_conn.commit()
+            _engines[key] = engine
+        return _engines[key]
+
+# --- QUERY INSTRUMENTATION ---
+# Every read_sql call is recorded as {sql, rows, ms, at}. Listeners get each record as it happens.
+QUERY_LOG = deque(maxlen=200)
+_listeners = []
+
+def add_query_listener(fn):
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+def log_slow_queries(record):
+    if record["ms"] >= SLOW_QUERY_MS:
+        print(f"🐢 Slow query ({record['ms']:.0f}ms, {record['rows']} rows): {record['sql'][:200]}")
+
+add_query_listener(log_slow_queries)
+
+def record_query(sql, rows, elapsed):
+    record = {
+        "sql": " ".join(str(sql).split()),
+        "rows": rows,
+        "ms": elapsed * 1000,
+        "at": datetime.now().isoformat(timespec="seconds"),
+    }
+    QUERY_LOG.append(record)
+    for fn in list(_listeners):
+        try:
+            fn(record)
+        except Exception:
+            pass
+    return record
+
+def read_sql(sql, engine, params=None):
+    # pd.read_sql with timing
+    started = time.perf_counter()
+    df = pd.read_sql(sql, engine, params=params)
+    record_query(sql, len(df), time.perf_counter() - started)
+    return df
@@ -0,0 +1,302 @@
+import io
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- SCHEMA ---
+# Snapshot columns as built by collector.build_player_row (minus snapshot_time)
+PLAYER_STATE_COLUMNS = [
+    ("player_id", "INTEGER NOT NULL"), ("web_name", "TEXT"), ("team_code", "SMALLINT"), ("position_id", "SMALLINT"),
+    ("status", "TEXT"), ("news", "TEXT"),
+    ("cost", "REAL"), ("selected_by_percent", "REAL"), ("transfers_in_event", "INTEGER"), ("transfers_out_event", "INTEGER"),
+    ("value_form", "REAL"), ("value_season", "REAL"), ("form", "REAL"),
+    ("minutes", "INTEGER"), ("total_points", "INTEGER"), ("points_per_game", "REAL"), ("starts", "INTEGER"),
+    ("matches_played", "INTEGER"),
+    ("goals_scored", "INTEGER"), ("assists", "INTEGER"),
+    ("clean_sheets", "INTEGER"), ("goals_conceded", "INTEGER"), ("own_goals", "INTEGER"), ("penalties_saved", "INTEGER"),
+    ("defensive_contributions", "INTEGER"), ("tackles", "INTEGER"), ("recoveries", "INTEGER"), ("cbi", "INTEGER"),
+    ("xg", "REAL"), ("xa", "REAL"), ("xgi", "REAL"), ("xgc", "REAL"),
+    ("bonus", "INTEGER"), ("bps", "INTEGER"), ("ict_index", "REAL"),
+]
+STATE_COLUMN_LIST = ", ".join(name for name, _ in PLAYER_STATE_COLUMNS)
+# Move for most players every day, so they are not part of delta change detection: their values are
+# kept per snapshot in the narrow fpl_player_volatile table and joined back in by the state views
+VOLATILE_COLUMNS = ("selected_by_percent", "transfers_in_event", "transfers_out_event")
+
+def state_select(state, volatile):
+    # STATE_COLUMN_LIST with the volatile columns taken from `volatile` (rows older than that table fall back)
+    return ", ".join(f"COALESCE({volatile}.{name}, {state}.{name}) AS {name}" if name in VOLATILE_COLUMNS
+                     else f"{state}.{name}" for name, _ in PLAYER_STATE_COLUMNS)
+
+# Tables owned by the collector. fpl_full_history / human_readable_fpl predate this and are managed in Supabase.
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS fpl_player_gameweek (
+        player_id INTEGER NOT NULL,
+        fixture_id INTEGER NOT NULL,
+        round SMALLINT,
+        opponent_team SMALLINT,
+        was_home BOOLEAN,
+        kickoff_time TIMESTAMPTZ,
+        minutes SMALLINT,
+        total_points SMALLINT,
+        starts SMALLINT,
+        goals_scored SMALLINT,
+        assists SMALLINT,
+        clean_sheets SMALLINT,
+        goals_conceded SMALLINT,
+        own_goals SMALLINT,
+        penalties_saved SMALLINT,
+        saves SMALLINT,
+        bonus SMALLINT,
+        bps SMALLINT,
+        defensive_contributions SMALLINT,
+        tackles SMALLINT,
+        recoveries SMALLINT,
+        cbi SMALLINT,
+        xg REAL,
+        xa REAL,
+        xgi REAL,
+        xgc REAL,
+        cost REAL,
+        selected INTEGER,
+        PRIMARY KEY (player_id, fixture_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS fpl_player_gameweek_recent_idx ON fpl_player_gameweek (player_id, kickoff_time DESC)",
+
+    # --- DELTA STORAGE ---
+    # One row per player per distinct state, valid over [valid_from, valid_to). valid_to IS NULL = current.
+    f"""
+    CREATE TABLE IF NOT EXISTS fpl_player_state (
+        {", ".join(f"{name} {sql_type}" for name, sql_type in PLAYER_STATE_COLUMNS)},
+        valid_from TIMESTAMP NOT NULL,
+        valid_to TIMESTAMP,
+        PRIMARY KEY (player_id, valid_from)
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS fpl_player_state_current_idx ON fpl_player_state (player_id) WHERE valid_to IS NULL",
+    """
+    CREATE TABLE IF NOT EXISTS fpl_player_volatile (
+        player_id INTEGER NOT NULL,
+        snapshot_time TIMESTAMP NOT NULL,
+        selected_by_percent REAL,
+        transfers_in_event INTEGER,
+        transfers_out_event INTEGER,
+        PRIMARY KEY (player_id, snapshot_time)
+    )
+    """,
+    # Latest state: reads only the open rows through the partial index, plus each player's newest volatile row
+    f"""
+    CREATE OR REPLACE VIEW fpl_player_state_latest AS
+    SELECT {state_select("s", "v")}, s.valid_from AS snapshot_time
+    FROM fpl_player_state s
+    LEFT JOIN LATERAL (
+        SELECT * FROM fpl_player_volatile v WHERE v.player_id = s.player_id ORDER BY v.snapshot_time DESC LIMIT 1
+    ) v ON true
+    WHERE s.valid_to IS NULL
+    """,
+    # State at time T: SELECT * FROM fpl_player_state_at('2025-01-01 12:00')
+    f"""
+    CREATE OR REPLACE FUNCTION fpl_player_state_at(ts TIMESTAMP)
+    RETURNS TABLE ({", ".join(f"{name} {sql_type.replace(' NOT NULL', '')}" for name, sql_type in PLAYER_STATE_COLUMNS)}, snapshot_time TIMESTAMP)
+    LANGUAGE sql STABLE AS $$
+        SELECT {state_select("s", "v")}, s.valid_from
+        FROM fpl_player_state s
+        LEFT JOIN LATERAL (
+            SELECT * FROM fpl_player_volatile v
+            WHERE v.player_id = s.player_id AND v.snapshot_time <= ts ORDER BY v.snapshot_time DESC LIMIT 1
+        ) v ON true
+        WHERE s.valid_from <= ts AND (s.valid_to IS NULL OR s.valid_to > ts)
+    $$
+    """,
+    # --- LATEST STATE ---
+    # One row per player for the dashboard, refreshed at the end of each collector run so page loads
+    # never scan the history. max(snapshot_time) doubles as the snapshot version.
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS fpl_latest AS
+    SELECT DISTINCT ON (player_id)
+        player_id, web_name, team_name, position, cost, selected_by_percent, status, news,
+        minutes, starts, matches_played, total_points, points_per_game,
+        xg, xa, xgi, goals_scored, assists, clean_sheets, goals_conceded, xgc,
+        def_cons, tackles, recoveries, cbi, form, value_season, bps, snapshot_time
+    FROM human_readable_fpl ORDER BY player_id, snapshot_time DESC
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS fpl_latest_player_idx ON fpl_latest (player_id)",
+    # --- PRICE CHANGES ---
+    # One row per price move, written by the collector as each snapshot lands (see record_price_changes)
+    """
+    CREATE TABLE IF NOT EXISTS price_changes (
+        player_id INTEGER NOT NULL,
+        changed_at TIMESTAMP NOT NULL,
+        old_cost NUMERIC(4,1) NOT NULL,
+        new_cost NUMERIC(4,1) NOT NULL,
+        PRIMARY KEY (player_id, changed_at)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS price_changes_changed_at_idx ON price_changes (changed_at)",
+    # First run only: seed from the existing history with LAG (the one-time NOT EXISTS skips the scan afterwards)
+    """
+    INSERT INTO price_changes (player_id, changed_at, old_cost, new_cost)
+    SELECT player_id, snapshot_time, prev_cost, cost FROM (
+        SELECT player_id, snapshot_time, cost,
+               LAG(cost) OVER (PARTITION BY player_id ORDER BY snapshot_time) AS prev_cost
+        FROM human_readable_fpl
+    ) h
+    WHERE prev_cost IS NOT NULL AND prev_cost::NUMERIC(4,1) <> cost::NUMERIC(4,1)
+      AND NOT EXISTS (SELECT 1 FROM price_changes)
+    ON CONFLICT DO NOTHING
+    """,
+    # Drop-in for fpl_full_history: every change point as a snapshot row (volatile columns: the newest value
+    # within that state's validity, so the open row is current). Point human_readable_fpl here
+    # and its DISTINCT ON / ROW_NUMBER queries keep working over far fewer rows.
+    f"""
+    CREATE OR REPLACE VIEW fpl_state_history AS
+    SELECT {state_select("s", "v")}, s.valid_from AS snapshot_time
+    FROM fpl_player_state s
+    LEFT JOIN LATERAL (
+        SELECT * FROM fpl_player_volatile v
+        WHERE v.player_id = s.player_id AND v.snapshot_time >= s.valid_from AND (s.valid_to IS NULL OR v.snapshot_time < s.valid_to)
+        ORDER BY v.snapshot_time DESC LIMIT 1
+    ) v ON true
+    """,
+]
+
+def ensure_schema(conn):
+    with transaction(conn) as cursor:
+        for statement in SCHEMA_SQL:
+            cursor.execute(statement)
+
+@contextmanager
+def transaction(conn):
+    try:
+        with conn.cursor() as cursor:
+            yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# --- COPY FORMATTING ---
+# Strings are always quoted and NULL is an unquoted \N, so an empty 'news' stays '' and never becomes NULL.
+NULL = "\\N"
+COPY_OPTIONS = "FORMAT csv, NULL '\\N'"
+
+def format_value(val):
+    if val is None:
+        return NULL
+    if isinstance(val, bool):
+        return "true" if val else "false"
+    if isinstance(val, (int, float)):
+        return repr(val)
+    if isinstance(val, datetime):
+        val = val.isoformat()
+    return '"' + str(val).replace('"', '""') + '"'
+
+def rows_to_buffer(rows, columns):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(",".join(format_value(row[col]) for col in columns))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+def copy_rows(cursor, table, columns, rows):
+    buf = rows_to_buffer(rows, columns)
+    cursor.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH ({COPY_OPTIONS})", buf)
+
+def create_stage(cursor, table, columns):
+    # Same column types as the target, but no defaults/constraints (no sequence values burned)
+    stage = f"{table}_stage"
+    cursor.execute(f"DROP TABLE IF EXISTS {stage}")
+    cursor.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {','.join(columns)} FROM {table} WITH NO DATA")
+    return stage
+
+# --- BULK LOADER ---
+# insert_rows/upsert_rows COPY into a temp staging table and move everything into the target with one
+# statement. They don't commit: wrap several in transaction() to land them together or not at all.
+def insert_rows(cursor, table, rows, columns=None):
+    if not rows: return 0
+    columns = list(columns or rows[0].keys())
+    cols = ','.join(columns)
+    stage = create_stage(cursor, table, columns)
+    copy_rows(cursor, stage, columns, rows)
+    cursor.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage}")
+    return len(rows)
+
+def upsert_rows(cursor, table, rows, key_columns, columns=None):
+    if not rows: return 0
+    columns = list(columns or rows[0].keys())
+    cols = ','.join(columns)
+    updates = ','.join(f"{col} = EXCLUDED.{col}" for col in columns if col not in key_columns)
+    stage = create_stage(cursor, table, columns)
+    copy_rows(cursor, stage, columns, rows)
+    cursor.execute(
+        f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} "
+        f"ON CONFLICT ({','.join(key_columns)}) DO UPDATE SET {updates}"
+    )
+    return len(rows)
+
+def bulk_insert(conn, table, rows, columns=None):
+    # Single-table load in its own transaction: either the whole batch lands or none of it does
+    if not rows: return 0
+    started = time.perf_counter()
+    with transaction(conn) as cursor:
+        n_rows = insert_rows(cursor, table, rows, columns)
+    report_load(table, n_rows, time.perf_counter() - started)
+    return n_rows
+
+def apply_deltas(cursor, rows, time_column="snapshot_time"):
+    # Writes a fpl_player_state row only for players whose values differ from their open row.
+    # Changed players get their open row closed at this snapshot's time. Replaying a snapshot is a no-op.
+    # The VOLATILE_COLUMNS don't count as a change; they go to fpl_player_volatile for every player.
+    if not rows: return 0
+    columns = [name for name, _ in PLAYER_STATE_COLUMNS]
+    tracked = [col for col in columns if col != "player_id" and col not in VOLATILE_COLUMNS]
+    state_rows = [dict(row, valid_from=row[time_column]) for row in rows]
+    stage = create_stage(cursor, "fpl_player_state", columns + ["valid_from"])
+    copy_rows(cursor, stage, columns + ["valid_from"], state_rows)
+    cursor.execute(f"""
+        UPDATE fpl_player_state t SET valid_to = s.valid_from
+        FROM {stage} s
+        WHERE t.player_id = s.player_id AND t.valid_to IS NULL AND t.valid_from < s.valid_from
+          AND ({", ".join(f"t.{col}" for col in tracked)}) IS DISTINCT FROM ({", ".join(f"s.{col}" for col in tracked)})
+    """)
+    cursor.execute(f"""
+        INSERT INTO fpl_player_state ({STATE_COLUMN_LIST}, valid_from)
+        SELECT {STATE_COLUMN_LIST}, valid_from FROM {stage} s
+        WHERE NOT EXISTS (SELECT 1 FROM fpl_player_state t WHERE t.player_id = s.player_id AND t.valid_to IS NULL)
+    """)
+    changed = cursor.rowcount
+    volatile_rows = [dict({col: row[col] for col in VOLATILE_COLUMNS}, player_id=row["player_id"], snapshot_time=row[time_column])
+                     for row in rows]
+    upsert_rows(cursor, "fpl_player_volatile", volatile_rows, ("player_id", "snapshot_time"))
+    return changed
+
+def record_price_changes(cursor, rows, time_column="snapshot_time", source="fpl_latest"):
+    # Compares this snapshot's prices with the previous run's: fpl_latest until refresh_latest, or
+    # fpl_player_state_latest in delta mode (fpl_full_history, and so fpl_latest, is not written there;
+    # call this before apply_deltas, which moves the open rows to the new prices).
+    if not rows: return 0
+    change_rows = [{"player_id": row["player_id"], "new_cost": row["cost"], "changed_at": row[time_column]} for row in rows]
+    stage = create_stage(cursor, "price_changes", ["player_id", "new_cost", "changed_at"])
+    copy_rows(cursor, stage, ["player_id", "new_cost", "changed_at"], change_rows)
+    cursor.execute(f"""
+        INSERT INTO price_changes (player_id, changed_at, old_cost, new_cost)
+        SELECT s.player_id, s.changed_at, l.cost::NUMERIC(4,1), s.new_cost
+        FROM {stage} s JOIN {source} l ON l.player_id = s.player_id
+        WHERE l.cost::NUMERIC(4,1) <> s.new_cost AND l.snapshot_time < s.changed_at
+        ON CONFLICT DO NOTHING
+    """)
+    return cursor.rowcount
+
+def refresh_latest(conn):
+    # CONCURRENTLY keeps fpl_latest readable by the dashboard while it rebuilds
+    started = time.perf_counter()
+    with transaction(conn) as cursor:
+        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY fpl_latest")
+    print(f"🔄 Refreshed fpl_latest in {time.perf_counter() - started:.2f}s")
+
+def report_load(table, n_rows, elapsed):
+    rate = n_rows / elapsed if elapsed > 0 else float("inf")
+    print(f"✅ Loaded {n_rows} rows into {table} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
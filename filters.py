@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import numpy as np
+import pandas as pd
+
+# --- FILTER INDEX ---
+# Built once per snapshot. Categorical columns become a packed bitmap per value; numeric columns are
+# kept as (sort order, sorted values), so a range filter is two binary searches. Every filter yields a
+# packed bitset and they are combined with bitwise AND, so a query touches n / 8 bytes per condition.
+
+UNAVAILABLE = ('i', 'u', 'n', 's')
+MIN_SEASON_MINUTES = 90
+CATEGORY_COLUMNS = ('team_name', 'position')
+RANGE_COLUMNS = ('cost', 'selected_by_percent', 'avg_minutes', 'points_per_game', 'dc_per_90')
+
+@dataclass(frozen=True)
+class FilterIndex:
+    n_rows: int
+    codes: Mapping        # column -> int16 code per row
+    bitmaps: Mapping      # column -> {value: packed bitset}
+    orders: Mapping       # column -> row positions sorted by value
+    sorted_values: Mapping  # column -> values in that order
+    base: np.ndarray      # packed bitset: played at least MIN_SEASON_MINUTES
+    available: np.ndarray # packed bitset: not injured / unavailable / suspended
+
+def pack(mask):
+    return np.packbits(mask)
+
+def build_filter_index(df):
+    n_rows = len(df)
+    codes, bitmaps = {}, {}
+    for col in CATEGORY_COLUMNS:
+        col_codes, values = pd.factorize(df[col])
+        codes[col] = col_codes.astype(np.int16)
+        bitmaps[col] = MappingProxyType({v: pack(col_codes == i) for i, v in enumerate(values)})
+
+    orders, sorted_values = {}, {}
+    for col in RANGE_COLUMNS:
+        values = df[col].to_numpy()
+        order = np.argsort(values, kind='stable')
+        orders[col] = order
+        sorted_values[col] = values[order]
+
+    return FilterIndex(
+        n_rows=n_rows,
+        codes=MappingProxyType(codes),
+        bitmaps=MappingProxyType(bitmaps),
+        orders=MappingProxyType(orders),
+        sorted_values=MappingProxyType(sorted_values),
+        base=pack(df['minutes'].to_numpy() >= MIN_SEASON_MINUTES),
+        available=pack(~df['status'].isin(UNAVAILABLE).to_numpy()),
+    )
+
+def category_bits(index, col, selected):
+    # OR of the bitmaps of the selected values; values not present in this snapshot match nothing
+    bits = np.zeros((index.n_rows + 7) // 8, dtype=np.uint8)
+    for value in selected:
+        value_bits = index.bitmaps[col].get(value)
+        if value_bits is not None:
+            bits |= value_bits
+    return bits
+
+def range_bits(index, col, low=None, high=None):
+    # Rows with low <= value <= high (either bound optional), via binary search on the sorted column.
+    # None when the range covers every row (a slider left at its end), so the caller can skip it.
+    values = index.sorted_values[col]
+    if values.dtype.kind == 'f':
+        # Compare in the column's own precision: a float32 15.1 is not <= the float64 slider value 15.1
+        low = None if low is None else values.dtype.type(low)
+        high = None if high is None else values.dtype.type(high)
+    start = 0 if low is None else np.searchsorted(values, low, side='left')
+    stop = len(values) if high is None else np.searchsorted(values, high, side='right')
+    if start == 0 and stop == index.n_rows:
+        return None
+    order = index.orders[col]
+    if stop - start > index.n_rows // 2:
+        # Wide range: scatter the (smaller) complement instead
+        mask = np.ones(index.n_rows, dtype=bool)
+        mask[order[:start]] = False
+        mask[order[stop:]] = False
+    else:
+        mask = np.zeros(index.n_rows, dtype=bool)
+        mask[order[start:stop]] = True
+    return pack(mask)
+
+def select(index, teams, positions, exclude_unavailable=False, ranges=None):
+    # Row positions (ascending) that pass every filter. ranges: column -> (low, high), None = open.
+    bits = index.base.copy()
+    if exclude_unavailable:
+        bits &= index.available
+    bits &= category_bits(index, 'team_name', teams)
+    bits &= category_bits(index, 'position', positions)
+    for col, (low, high) in (ranges or {}).items():
+        col_bits = range_bits(index, col, low, high)
+        if col_bits is not None:
+            bits &= col_bits
+    return np.flatnonzero(np.unpackbits(bits, count=index.n_rows).view(bool))
@@ -0,0 +1,315 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- CONFIGURATION ---
+API_URL = "https://fantasy.premierleague.com/api"
+TIMEOUT = float(os.environ.get("FPL_HTTP_TIMEOUT", "10"))          # seconds per attempt
+MAX_RETRIES = int(os.environ.get("FPL_HTTP_RETRIES", "5"))
+RATE_LIMIT = float(os.environ.get("FPL_RATE_LIMIT", "20"))         # requests / second (ceiling)
+MIN_RATE = 0.5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+BREAKER_THRESHOLD = 10                                              # consecutive failures before opening
+BREAKER_RESET = 30.0                                                # seconds before a trial request
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# --- RESPONSE CACHE ---
+CACHE_ENABLED = os.environ.get("FPL_HTTP_CACHE", "1") == "1"
+CACHE_PATH = os.environ.get("FPL_HTTP_CACHE_PATH", os.path.join(".fpl_cache", "http_cache.sqlite"))
+# Serve only from the cache, never touch the network (local dev / tests)
+OFFLINE = os.environ.get("FPL_OFFLINE", "0") == "1"
+# Seconds a cached body is served without revalidation, by endpoint prefix. 0 = always revalidate.
+CACHE_TTLS = {
+    "bootstrap-static/": 300,
+    "fixtures/": 600,
+    "element-summary/": 0,
+}
+DEFAULT_TTL = 0
+
+
+class FPLAPIError(Exception):
+    pass
+
+
+class CircuitOpenError(FPLAPIError):
+    pass
+
+
+# --- RATE LIMITER ---
+class TokenBucket:
+    # AIMD token bucket: halves its rate on a 429 and creeps back up on every success
+    def __init__(self, rate=RATE_LIMIT, min_rate=MIN_RATE):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+# --- CIRCUIT BREAKER ---
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # Half-open: let requests through, the next failure re-opens immediately
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return
+        raise CircuitOpenError(f"FPL API circuit open after {self.threshold} consecutive failures")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def full_url(url):
+    if url.startswith("http"):
+        return url
+    return f"{API_URL}/{url.lstrip('/')}"
+
+
+def backoff_delay(attempt):
+    # Full jitter exponential backoff
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def endpoint_ttl(url):
+    path = url[len(API_URL):].lstrip("/") if url.startswith(API_URL) else url
+    for prefix, ttl in CACHE_TTLS.items():
+        if path.startswith(prefix):
+            return ttl
+    return DEFAULT_TTL
+
+
+class ResponseCache:
+    # URL -> zlib-compressed body plus validators, in a single SQLite file
+    def __init__(self, path=CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.stats = {"hit": 0, "revalidated": 0, "miss": 0}
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, etag, last_modified, fetched_at = row
+        return {"body": zlib.decompress(body), "etag": etag, "last_modified": last_modified, "fetched_at": fetched_at}
+
+    def store(self, url, body, etag=None, last_modified=None):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, body, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, zlib.compress(body), etag, last_modified, time.time()),
+            )
+            self.conn.commit()
+
+    def touch(self, url):
+        with self.lock:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+# --- CLIENT ---
+class FPLClient:
+    def __init__(self, pool_size=10, rate=RATE_LIMIT, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 use_cache=CACHE_ENABLED, offline=OFFLINE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount("https://", adapter)
+        self.limiter = TokenBucket(rate)
+        self.breaker = CircuitBreaker()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.offline = offline
+        self.cache = get_cache() if (use_cache or offline) else None
+
+    def get(self, url, headers=None):
+        url = full_url(url)
+        if self.offline:
+            raise FPLAPIError(f"Offline mode: refusing network request for {url}")
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self.breaker.check()
+            self.limiter.acquire()
+            try:
+                resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                self.breaker.record_failure()
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if resp.status_code == 429:
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                self.limiter.throttle(retry_after)
+                last_error = FPLAPIError(f"429 Too Many Requests for {url}")
+                time.sleep(max(retry_after or 0, backoff_delay(attempt)))
+                continue
+            if resp.status_code in RETRY_STATUSES:
+                self.breaker.record_failure()
+                last_error = FPLAPIError(f"{resp.status_code} for {url}")
+                time.sleep(backoff_delay(attempt))
+                continue
+            if resp.status_code >= 400:
+                # Other 4xx responses will not get better on retry
+                raise FPLAPIError(f"{resp.status_code} for {url}")
+
+            self.breaker.record_success()
+            self.limiter.recover()
+            return resp
+
+        raise FPLAPIError(f"Giving up on {url} after {self.max_retries + 1} attempts: {last_error}")
+
+    def get_json(self, url):
+        url = full_url(url)
+        if self.cache is None:
+            return self.get(url).json()
+
+        entry = self.cache.lookup(url)
+        if self.offline:
+            if entry is None:
+                raise FPLAPIError(f"Offline mode: {url} is not in the cache")
+            self.cache.count("hit")
+            return json.loads(entry["body"])
+
+        if entry is not None and time.time() - entry["fetched_at"] < endpoint_ttl(url):
+            self.cache.count("hit")
+            return json.loads(entry["body"])
+
+        # Conditional request: a 304 costs a round-trip but no body
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = self.get(url, headers=headers)
+        if resp.status_code == 304 and entry is not None:
+            self.cache.touch(url)
+            self.cache.count("revalidated")
+            return json.loads(entry["body"])
+
+        self.cache.store(url, resp.content, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        self.cache.count("miss")
+        return resp.json()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # Process-wide client so every caller shares one limiter and breaker
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = FPLClient()
+        return _client
+
+def get_json(url):
+    return get_client().get_json(url)
@@ -0,0 +1,133 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+# --- CONFIGURATION ---
+# One journal per collector run ID. Defaults to the UTC date, so a crashed daily run picks up where it
+# stopped when it is started again the same day. Set FPL_RUN_ID to resume (or force) a specific run.
+RUN_DIR = os.environ.get("FPL_RUN_DIR", os.path.join(".fpl_cache", "runs"))
+ENABLED = os.environ.get("FPL_RUN_JOURNAL", "1") == "1"
+# Journals of runs that never finished are dropped after this many days
+MAX_AGE_DAYS = 7
+
+def default_run_id():
+    return os.environ.get("FPL_RUN_ID") or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+def encode(value):
+    return zlib.compress(json.dumps(value).encode())
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob))
+
+def remove_journal(path):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+# --- RUN JOURNAL ---
+# Everything a run needs to be finished without the FPL API: the bootstrap payload it started from,
+# its snapshot_time, and each player's derived rows as soon as they are built. Rows are marked written
+# once their database batch commits. The file is deleted when the run completes, so only unfinished
+# runs leave a journal behind.
+class RunJournal:
+    def __init__(self, run_id, directory=RUN_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(directory, f"{run_id}.sqlite")
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # WAL + NORMAL: a commit per player stays cheap and survives the process dying
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS players (
+                player_id INTEGER PRIMARY KEY,
+                rows BLOB NOT NULL,
+                written INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        # Players fetched by an earlier attempt but not confirmed written: the database may already
+        # hold them (crash between COMMIT and mark_written), so their batch replaces instead of appending.
+        self.replayed = set(self.player_ids(written=0))
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else decode(row[0])
+
+    def setdefault(self, key, value):
+        # First attempt stores value; later attempts get the stored one back
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, encode(value)))
+            self.conn.commit()
+        return self.get(key)
+
+    def player_ids(self, written=None):
+        sql = "SELECT player_id FROM players"
+        params = ()
+        if written is not None:
+            sql += " WHERE written = ?"
+            params = (written,)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(sql, params)]
+
+    def record(self, player_row, gameweek_rows):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO players (player_id, rows, written) VALUES (?, ?, 0)",
+                (player_row["player_id"], encode([player_row, gameweek_rows])),
+            )
+            self.conn.commit()
+
+    def pending(self):
+        # (player_row, gameweek_rows) already fetched but not yet written
+        with self.lock:
+            blobs = [row[0] for row in self.conn.execute("SELECT rows FROM players WHERE written = 0 ORDER BY player_id")]
+        return [tuple(decode(blob)) for blob in blobs]
+
+    def mark_written(self, player_ids):
+        with self.lock:
+            self.conn.executemany("UPDATE players SET written = 1 WHERE player_id = ?", [(pid,) for pid in player_ids])
+            self.conn.commit()
+
+    def counts(self):
+        with self.lock:
+            fetched, written = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(written), 0) FROM players").fetchone()
+        return fetched, written
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def finish(self):
+        # Run complete: nothing left to resume
+        self.close()
+        remove_journal(self.path)
+
+
+def prune(directory=RUN_DIR, max_age_days=MAX_AGE_DAYS):
+    cutoff = time.time() - max_age_days * 86400
+    for path in glob.glob(os.path.join(directory, "*.sqlite")):
+        if os.path.getmtime(path) < cutoff:
+            remove_journal(path)
+
+def open_run(run_id=None):
+    # None when journaling is switched off (FPL_RUN_JOURNAL=0)
+    if not ENABLED:
+        return None
+    prune()
+    journal = RunJournal(run_id or default_run_id())
+    fetched, written = journal.counts()
+    if fetched:
+        print(f"📒 Resuming run {journal.run_id}: {fetched} players already fetched, {written} written")
+    return journal
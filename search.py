@@ -0,0 +1,90 @@
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import numpy as np
+
+# --- PLAYER SEARCH INDEX ---
+# Built once per snapshot from web_name. Names are accent-folded and lowercased, so "odegaard" finds
+# "Ødegaard". Queries of 3+ characters intersect trigram posting lists and then verify the substring;
+# shorter ones scan the folded names. Matches rank exact > name prefix > word prefix > substring.
+
+NGRAM = 3
+# Letters NFKD does not decompose into base + combining mark
+FOLD_MAP = str.maketrans({
+    'ø': 'o', 'Ø': 'o', 'æ': 'ae', 'Æ': 'ae', 'œ': 'oe', 'Œ': 'oe', 'ß': 'ss',
+    'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd', 'ð': 'd', 'Ð': 'd', 'þ': 'th', 'Þ': 'th', 'ı': 'i',
+})
+
+def fold(text):
+    text = unicodedata.normalize('NFKD', str(text).translate(FOLD_MAP))
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold().strip()
+
+@dataclass(frozen=True)
+class SearchIndex:
+    names: np.ndarray       # row -> display name
+    folded: tuple           # row -> folded name
+    grams: Mapping          # trigram -> sorted row positions containing it
+    alpha_rank: np.ndarray  # row -> place in plain alphabetical order of names
+
+def build_search_index(names):
+    names = np.asarray(names, dtype=object)
+    folded = tuple(fold(n) for n in names)
+    grams = defaultdict(list)
+    for row, name in enumerate(folded):
+        for gram in {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}:
+            grams[gram].append(row)
+    order = sorted(range(len(names)), key=lambda r: names[r])
+    alpha_rank = np.empty(len(names), dtype=np.int64)
+    alpha_rank[order] = np.arange(len(names))
+    return SearchIndex(
+        names=names,
+        folded=folded,
+        grams=MappingProxyType({g: np.array(rows, dtype=np.int64) for g, rows in grams.items()}),
+        alpha_rank=alpha_rank,
+    )
+
+def match_rows(index, query):
+    # Row positions (ascending) whose folded name contains the folded query
+    q = fold(query)
+    if not q:
+        return np.arange(len(index.folded))
+    if len(q) < NGRAM:
+        return np.array([r for r, name in enumerate(index.folded) if q in name], dtype=np.int64)
+    postings = []
+    for gram in {q[i:i + NGRAM] for i in range(len(q) - NGRAM + 1)}:
+        rows = index.grams.get(gram)
+        if rows is None:
+            return np.array([], dtype=np.int64)
+        postings.append(rows)
+    postings.sort(key=len)
+    candidates = postings[0]
+    for rows in postings[1:]:
+        candidates = np.intersect1d(candidates, rows, assume_unique=True)
+    if len(q) == NGRAM:
+        return candidates
+    return np.array([r for r in candidates.tolist() if q in index.folded[r]], dtype=np.int64)
+
+def match_mask(index, query):
+    mask = np.zeros(len(index.folded), dtype=bool)
+    mask[match_rows(index, query)] = True
+    return mask
+
+def match_tier(name, q):
+    if name == q: return 0
+    if name.startswith(q): return 1
+    if any(word.startswith(q) for word in name.replace('-', ' ').split()): return 2
+    return 3
+
+def ranked_names(index, rows, query=""):
+    # Unique display names of `rows`, best match first, alphabetical within a tier
+    rows = np.asarray(rows, dtype=np.int64)
+    q = fold(query)
+    if q:
+        tiers = np.array([match_tier(index.folded[r], q) for r in rows.tolist()], dtype=np.int64)
+        rows = rows[np.lexsort((index.alpha_rank[rows], tiers))]
+    else:
+        rows = rows[np.argsort(index.alpha_rank[rows])]
+    return list(dict.fromkeys(index.names[rows].tolist()))
@@ -0,0 +1,126 @@
+import glob
+import os
+import re
+import time
+
+import database
+
+# pyarrow is optional: without it the store is disabled and every read goes to Postgres
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# --- CONFIGURATION ---
+SNAPSHOT_DIR = os.environ.get("FPL_SNAPSHOT_DIR", os.path.join(".fpl_cache", "snapshots"))
+ENABLED = pq is not None and os.environ.get("FPL_SNAPSHOT_STORE", "1") == "1"
+KEEP_SNAPSHOTS = 3
+DICTIONARY_COLUMNS = ['team_name', 'position', 'status']
+VERSION_KEY = b"fpl_snapshot_version"
+
+# One row per player, newest snapshot. Shared by the dashboard (data_engine) and the collector's export.
+LATEST_PLAYERS_SQL = """
+SELECT
+    player_id, web_name, team_name, position, cost, selected_by_percent, status, news,
+    minutes, starts, matches_played, total_points, points_per_game,
+    xg, xa, xgi, goals_scored, assists, clean_sheets, goals_conceded, xgc,
+    def_cons, tackles, recoveries, cbi, form, value_season, bps, snapshot_time
+FROM fpl_latest
+"""
+
+# --- LOCAL SNAPSHOT FILES ---
+# players-<version>.parquet per snapshot (zstd, dictionary-encoded categoricals), newest KEEP_SNAPSHOTS kept.
+# Read with memory_map, so a cold start is a local read instead of a remote query, and the dashboard
+# still has data when the database is unreachable.
+
+def version_slug(version):
+    return re.sub(r"\D", "", str(version))
+
+def players_path(version):
+    return os.path.join(SNAPSHOT_DIR, f"players-{version_slug(version)}.parquet")
+
+def frame_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.parquet")
+
+def write_table(df, path, metadata=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+    use_dictionary = [c for c in DICTIONARY_COLUMNS if c in df.columns]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp, compression="zstd", use_dictionary=use_dictionary or False)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+def read_table(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return pq.read_table(path, memory_map=True).to_pandas(split_blocks=True, self_destruct=True)
+    except Exception as e:
+        print(f"⚠️ Unreadable snapshot file {path}: {e}")
+        return None
+
+def write_players(df, version):
+    if not ENABLED or version is None:
+        return
+    try:
+        write_table(df, players_path(version), {VERSION_KEY: str(version).encode()})
+        prune()
+    except Exception as e:
+        print(f"⚠️ Could not write local snapshot: {e}")
+
+def read_players(version):
+    if not ENABLED or version is None:
+        return None
+    return read_table(players_path(version))
+
+def snapshot_files():
+    # Oldest first. Versions are timestamps, so their digit strings sort chronologically.
+    return sorted(glob.glob(os.path.join(SNAPSHOT_DIR, "players-*.parquet")))
+
+def latest_version():
+    # Version of the newest local snapshot, for when Postgres can't be asked
+    if not ENABLED:
+        return None
+    for path in reversed(snapshot_files()):
+        try:
+            metadata = pq.read_schema(path, memory_map=True).metadata or {}
+        except Exception:
+            continue
+        if VERSION_KEY in metadata:
+            return metadata[VERSION_KEY].decode()
+    return None
+
+def prune():
+    for path in snapshot_files()[:-KEEP_SNAPSHOTS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def write_frame(name, df):
+    # Last good result of a derived query (e.g. price changes), served only as an outage fallback
+    if not ENABLED:
+        return
+    try:
+        write_table(df, frame_path(name), {b"written_at": str(time.time()).encode()})
+    except Exception as e:
+        print(f"⚠️ Could not write local {name}: {e}")
+
+def read_frame(name):
+    if not ENABLED:
+        return None
+    return read_table(frame_path(name))
+
+def export_latest(engine):
+    # Collector side: after fpl_latest is refreshed, save it as the local snapshot the dashboard reads
+    if not ENABLED:
+        return None
+    df = database.read_sql(LATEST_PLAYERS_SQL, engine)
+    if df.empty:
+        return None
+    version = str(df['snapshot_time'].max())
+    write_players(df, version)
+    return version
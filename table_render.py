@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- PLAYER TABLE RENDERER ---
+# Builds the modern-table HTML column by column from NumPy arrays instead of row by row with iterrows.
+# Every per-row decision (status styling, team badge, fixture strip, number formatting) is made once per
+# snapshot; rendering a given filter/sort is then a gather over those pre-built cells.
+
+UNAVAILABLE = ('i', 'u', 'n', 's')
+INT_COLUMNS = ('matches_played', 'avg_minutes', 'total_points', 'goals_scored', 'assists', 'clean_sheets', 'goals_conceded')
+BASE_HEADERS = ["Player", "Next 5", "Price", "Own%", "Matches"]
+BASE_COLUMNS = ['cost', 'selected_by_percent', 'matches_played']
+PAGE_SIZE = 50
+
+FDR_COLORS = {1: '#375523', 2: '#00FF85', 3: '#EBEBEB', 4: '#FF0055', 5: '#680808'}
+FDR_TEXT = {1: 'white', 2: 'black', 3: 'black', 4: 'white', 5: 'white'}
+
+# Row openers by status class: 0 = unavailable, 1 = doubtful, 2 = available
+ROW_OPEN = [
+    '<tr style="background-color: rgba(255, 0, 85, 0.15); border-left: 4px solid #FF0055;">',
+    '<tr style="background-color: rgba(255, 204, 0, 0.15); border-left: 4px solid #FFCC00;">',
+    '<tr style="background-color: rgba(255, 255, 255, 0.03); border-left: 4px solid rgba(255, 255, 255, 0.05);">',
+]
+STATUS_DOT = [
+    '<span class="status-pill" style="background-color: #FF0055;"></span>',
+    '<span class="status-pill" style="background-color: #FFCC00;"></span>',
+    '<span class="status-pill" style="background-color: #00FF85;"></span>',
+]
+# Player cell, split around its four variable parts (dot, badge code, name, "team | position")
+PLAYER_OPEN = """
+        <td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 12px;">
+            <div style="width: 10px;">"""
+BADGE_OPEN = """</div><img src="https://resources.premierleague.com/premierleague/badges/20/t"""
+BADGE_CLOSE = """.png" style="width: 35px;">
+            <div style="display: flex; flex-direction: column;"><span style="font-weight: bold; color: #FFF;">"""
+NAME_CLOSE = """</span><span style="font-size: 0.8rem; color: #AAA;">"""
+PLAYER_CLOSE = """</span></div>
+        </div></td>"""
+
+
+def column_store(df):
+    # Column name -> NumPy array, built once per snapshot. Row i of every array is row i of df.
+    # Formatted cells are memoized into the same dict the first time a column is rendered.
+    return {col: df[col].to_numpy() for col in df.columns}
+
+
+def status_classes(status):
+    return np.select([np.isin(status, UNAVAILABLE), status == 'd'], [0, 1], default=2)
+
+
+def build_fragments(team_map, team_fixtures):
+    # Per-team HTML built once per data refresh: badge code and the finished "Next 5" <td>
+    fixtures = {}
+    for team, team_fix in team_fixtures.items():
+        boxes = "".join(
+            f'<div class="mini-fix-box" style="background-color: {FDR_COLORS.get(f["diff"], "#333")}; '
+            f'color: {FDR_TEXT.get(f["diff"], "white")}; min-width: 38px; text-align: center;">{f["opp"]}</div>'
+            for f in team_fix
+        )
+        fixtures[team] = f'<td style="text-align: center;"><div class="mini-fix-container">{boxes}</div></td>'
+    return {
+        # Content hash, so render cache keys change when fixtures or badges do
+        "version": hash((tuple(sorted(team_map.items())), tuple(sorted(fixtures.items())))),
+        "codes": dict(team_map),
+        "fixtures": fixtures,
+        "no_fixtures": '<td style="text-align: center;"><div class="mini-fix-container"></div></td>',
+    }
+
+
+def format_column(col_name, values):
+    # Same display rules the table has always used: floats to 2dp first, then per-column formatting
+    if values.dtype.kind == 'f':
+        text = [f"{v:.2f}" for v in values.tolist()]
+    else:
+        text = [str(v) for v in values.tolist()]
+    if col_name == 'cost':
+        return [f"£{float(v):.1f}" for v in text]
+    if col_name == 'selected_by_percent':
+        return [f"{v}%" for v in text]
+    if col_name in INT_COLUMNS:
+        return [str(int(float(v))) for v in text]
+    return text
+
+
+def cell_column(store, col_name, selected):
+    # Every row's finished <td> for one column, formatted once per snapshot
+    key = ('cells', col_name, selected)
+    cells = store.get(key)
+    if cells is None:
+        style = "text-align: center;"
+        if selected: style += " font-weight: bold; color: #00FF85;"
+        open_td = f'<td style="{style}">'
+        cells = np.array([f"{open_td}{v}</td>" for v in format_column(col_name, store[col_name])], dtype=object)
+        store[key] = cells
+    return cells
+
+
+def row_prefixes(store, fragments):
+    # Every row's <tr> opener + player cell + fixture strip, built once per snapshot and fragment set
+    cached = store.get(('cells', 'prefix'))
+    if cached is not None and cached[0] is fragments:
+        return cached[1]
+    codes, fix_cells, no_fix = fragments["codes"], fragments["fixtures"], fragments["no_fixtures"]
+    classes = status_classes(store['status'])
+    prefixes = np.array([
+        f"{ROW_OPEN[c]}{PLAYER_OPEN}{STATUS_DOT[c]}{BADGE_OPEN}{codes.get(team, 0)}{BADGE_CLOSE}"
+        f"{name}{NAME_CLOSE}{team} | {pos}{PLAYER_CLOSE}{fix_cells.get(team, no_fix)}"
+        for c, team, name, pos in zip(classes, store['team_name'].tolist(), store['web_name'].tolist(), store['position'].tolist())
+    ], dtype=object)
+    store[('cells', 'prefix')] = (fragments, prefixes)
+    return prefixes
+
+
+def rank_values(values):
+    # rank[i] = place of row i in a descending sort; ties keep frame order
+    order = np.argsort(-values, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def sort_rank(store, col_name):
+    # Descending rank of every row by one column, computed once per snapshot
+    key = ('rank', col_name)
+    rank = store.get(key)
+    if rank is None:
+        rank = rank_values(store[col_name])
+        store[key] = rank
+    return rank
+
+
+def page_rows(rank, rows, page, page_size=PAGE_SIZE):
+    # rows: positions passing the filters. Returns the positions on page `page` (0-based), in display order.
+    # Top-k by argpartition on the cached ranks, then only those k are sorted.
+    rows = np.asarray(rows)
+    k = min(len(rows), (page + 1) * page_size)
+    ranks = rank[rows]
+    top = np.argpartition(ranks, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+    top = top[np.argsort(ranks[top])]
+    return rows[top[page * page_size:k]]
+
+
+def render_player_table(store, rows, column_config, selected_col, fragments):
+    # store: column_store() arrays; rows: positions to show, already in display order.
+    # Per render this is only a gather of pre-built cells per column and one join.
+    headers = BASE_HEADERS + list(column_config.values())
+    header_html = "".join(f"<th>{h}</th>" for h in headers)
+
+    columns = [row_prefixes(store, fragments)[rows].tolist()]
+    for col_name in BASE_COLUMNS + list(column_config.keys()):
+        columns.append(cell_column(store, col_name, col_name == selected_col)[rows].tolist())
+    columns.append(["</tr>"] * len(rows))
+
+    body = "".join(["".join(cells) for cells in zip(*columns)])
+    return f"""<div class="player-table-container"><table class="modern-table"><thead><tr>{header_html}</tr></thead><tbody>{body}</tbody></table></div>"""
+
+
+# --- FIXTURE TICKER / PRICE MOVERS ---
+ICON_UP = '<svg width="24" height="24" viewBox="0 0 24 24" fill="none"><circle cx="12" cy="12" r="12" fill="#00FF85"/><path d="M7 14L12 9L17 14" stroke="black" stroke-width="3" stroke-linecap="round" stroke-linejoin="round"/></svg>'
+ICON_DOWN = '<svg width="24" height="24" viewBox="0 0 24 24" fill="none"><circle cx="12" cy="12" r="12" fill="#FF0055"/><path d="M7 10L12 15L17 10" stroke="white" stroke-width="3" stroke-linecap="round" stroke-linejoin="round"/></svg>'
+
+
+def render_fixture_ticker(t_df):
+    # t_df: data_engine.get_fixture_ticker() output, already sorted for display
+    gw_cols = [c for c in t_df.columns if c.startswith('GW')]
+    cells = []
+    for c in gw_cols:
+        diffs = t_df[f'Dif_{c}'].fillna(3).tolist() if f'Dif_{c}' in t_df.columns else [3] * len(t_df)
+        cells.append([
+            f'<td><span class="diff-badge" style="background-color: {FDR_COLORS.get(d, "#EBEBEB")}; '
+            f'color: {"white" if d in [1, 4, 5] else "black"};">{label}</span></td>'
+            for d, label in zip(diffs, t_df[c].tolist())
+        ])
+    team_cells = [
+        f'<tr><td style="padding-left: 15px; display: flex; align-items: center;"><img src="{logo}" style="width: 25px; margin-right: 10px;"><b>{team}</b></td>'
+        for logo, team in zip(t_df['Logo'].tolist(), t_df['Team'].tolist())
+    ]
+    body = "".join("".join(row) + "</tr>" for row in zip(team_cells, *cells))
+    header_html = "".join(f"<th>{c}</th>" for c in gw_cols)
+    return f"""<div class="fixture-table-container"><table class="modern-table"><thead><tr><th>Team</th>{header_html}</tr></thead><tbody>{body}</tbody></table></div>"""
+
+
+def render_price_movers(movers, team_map, rising):
+    # movers: rows of data_engine.get_db_price_changes(), already filtered to one direction and sorted
+    icon, color, sign = (ICON_UP, "#00FF85", "+") if rising else (ICON_DOWN, "#FF0055", "-")
+    rows = "".join(
+        f"""<tr><td style="padding-left: 20px;"><div style="display: flex; align-items: center; gap: 10px;">{icon}<img src="https://resources.premierleague.com/premierleague/badges/20/t{team_map.get(team, 0)}.png" style="width: 30px;"><div><b>{name}</b><br><span style="font-size:0.8rem; color:#AAA;">{team}</span></div></div></td><td style="text-align: center;">£{cost:.1f}</td><td style="text-align: center; color: {color};">{sign}£{abs(change):.1f}</td></tr>"""
+        for name, team, cost, change in zip(movers['web_name'].tolist(), movers['team'].tolist(), movers['cost'].tolist(), movers['change'].tolist())
+    )
+    return f"""<div class="player-table-container"><table class="modern-table"><thead><tr><th>Player</th><th>Price</th><th>Change</th></tr></thead><tbody>{rows}</tbody></table></div>"""
+
+
+# --- RENDER CACHE ---
+# Keyed by the caller on everything the HTML depends on (snapshot version, filters, sort, search, tab).
+# Shared across sessions: two users with the same view get the same bytes.
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+RENDER_CACHE_SIZE = 64
+
+
+def cached_render(key, build):
+    with _render_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+    html = build()
+    with _render_lock:
+        _render_cache[key] = html
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return html